@@ -0,0 +1,133 @@
+import os
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from spotify_auth import TokenManager, DEFAULT_ACCOUNT, ACCOUNT_NAME_PATTERN
+from spotify_client import SpotifyClient, ConnectionPool, ResponseCache, RateLimiter, LimiterChain, rate_limiter, disk_cache
+from spotify_search import LibraryIndex
+
+load_dotenv()
+
+# Cuentas que atiende el servidor, separadas por comas. Los tokens de cada una van en .env como
+# SPOTIFY_<CUENTA>_ACCESS_TOKEN, etc.; la cuenta "default" usa SPOTIFY_ACCESS_TOKEN sin prefijo.
+ACCOUNT_NAMES = tuple(
+    name.strip().lower() for name in os.getenv('SPOTIFY_ACCOUNTS', DEFAULT_ACCOUNT).split(',') if name.strip()
+) or (DEFAULT_ACCOUNT,)
+# Cuenta que usan las herramientas cuando no se indica el parámetro account
+DEFAULT_ACCOUNT_NAME = os.getenv('SPOTIFY_DEFAULT_ACCOUNT', ACCOUNT_NAMES[0]).strip().lower()
+
+# Token bucket propio de cada cuenta (con varias cuentas), además del límite global de la aplicación:
+# una cuenta con mucho tráfico no puede agotar el cupo de las demás
+ACCOUNT_RATE_LIMIT_PER_SECOND = float(os.getenv('SPOTIFY_ACCOUNT_RATE_LIMIT', '5'))
+ACCOUNT_RATE_LIMIT_BURST = int(os.getenv('SPOTIFY_ACCOUNT_RATE_LIMIT_BURST', '10'))
+
+# Cuenta seleccionada por la llamada en curso; run_in_worker copia el contexto a los hilos del pool
+current_account = contextvars.ContextVar('spotify_account', default=None)
+
+
+class UnknownAccountError(ValueError):
+    """Nombre de cuenta que no está configurado en SPOTIFY_ACCOUNTS"""
+
+
+class Account:
+    """Estado de una cuenta de Spotify: tokens, cliente (caché, dispositivo, reproductor) e índice de su biblioteca"""
+
+    __slots__ = ('name', 'tokens', 'client', 'library_index')
+
+    def __init__(self, name, tokens, client, library_index):
+        self.name = name
+        self.tokens = tokens
+        self.client = client
+        self.library_index = library_index
+
+
+class AccountRegistry:
+    """Cuentas del proceso; comparten el pool de conexiones, la caché del catálogo y el límite de la aplicación"""
+
+    def __init__(self, names=ACCOUNT_NAMES, default=DEFAULT_ACCOUNT_NAME,
+                 account_rate=ACCOUNT_RATE_LIMIT_PER_SECOND, account_burst=ACCOUNT_RATE_LIMIT_BURST):
+        for name in names:
+            if not ACCOUNT_NAME_PATTERN.match(name):
+                raise ValueError(f"Nombre de cuenta inválido en SPOTIFY_ACCOUNTS: {name!r}")
+        if default not in names:
+            raise ValueError(f"SPOTIFY_DEFAULT_ACCOUNT={default!r} no está en SPOTIFY_ACCOUNTS")
+
+        self.default = default
+        self.connections = ConnectionPool()
+        # Con una sola cuenta el cliente queda como antes: su caché incluye el catálogo
+        self.catalog_cache = ResponseCache(store=disk_cache) if len(names) > 1 else None
+        self._accounts = {}
+        for name in names:
+            tokens = TokenManager.from_env(name)
+            limiter = rate_limiter
+            if len(names) > 1 and account_rate > 0:
+                limiter = LimiterChain(RateLimiter(account_rate, account_burst), rate_limiter)
+            client = SpotifyClient(tokens, limiter=limiter, connections=self.connections,
+                                   catalog_cache=self.catalog_cache)
+            self._accounts[name] = Account(name, tokens, client, LibraryIndex(client))
+
+    @property
+    def names(self):
+        return list(self._accounts)
+
+    @property
+    def multiple(self):
+        return len(self._accounts) > 1
+
+    def get(self, name=None):
+        """Cuenta por nombre (la por defecto si es None); lanza UnknownAccountError si no existe"""
+        if name is not None and not isinstance(name, str):
+            raise UnknownAccountError("account debe ser texto")
+        account = self._accounts.get((name or self.default).strip().lower())
+        if account is None:
+            raise UnknownAccountError(f"Cuenta desconocida: {name}. Cuentas disponibles: {', '.join(self._accounts)}")
+        return account
+
+    def current(self):
+        """Cuenta de la llamada en curso, o la por defecto fuera de una llamada"""
+        return current_account.get() or self._accounts[self.default]
+
+    @contextmanager
+    def use(self, account=None):
+        """Selecciona la cuenta (Account o nombre) para el código y los workers que corren dentro del bloque"""
+        token = current_account.set(account if isinstance(account, Account) else self.get(account))
+        try:
+            yield current_account.get()
+        finally:
+            current_account.reset(token)
+
+    def __iter__(self):
+        return iter(self._accounts.values())
+
+    def has_credentials(self):
+        return any(account.tokens.has_credentials() for account in self)
+
+    def close(self):
+        self.connections.close()
+
+
+class AccountProxy:
+    """Atributo de la cuenta en curso (cliente, tokens o índice) con la interfaz del objeto original
+
+    Permite que las herramientas sigan usando client, token_manager y library_index como globales.
+    """
+
+    __slots__ = ('_registry', '_attribute')
+
+    def __init__(self, registry, attribute):
+        self._registry = registry
+        self._attribute = attribute
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._registry.current(), self._attribute), name)
+
+
+def account_property(registry):
+    """Propiedad común que anuncian las herramientas cuando el servidor tiene varias cuentas"""
+    return {
+        "account": {
+            "type": "string",
+            "description": f"Spotify account to act on (default: {registry.default})",
+            "enum": registry.names
+        }
+    }
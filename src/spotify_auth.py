@@ -1,16 +1,22 @@
 import os
-import requests
+import re
+import sys
+import time
+import threading
 import base64
-import webbrowser
 from urllib.parse import urlencode, parse_qs, urlparse
-from dotenv import load_dotenv
+from dotenv import load_dotenv, find_dotenv
 
 load_dotenv()
 
 CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 REDIRECT_URI = 'https://github.com/josuemj/spotify-mcp'
-SCOPE = 'user-read-playback-state user-modify-playback-state user-read-currently-playing user-top-read user-library-read playlist-modify-public playlist-modify-private'
+TOKEN_URL = os.getenv('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+# Cuenta cuyos tokens se guardan sin prefijo (SPOTIFY_ACCESS_TOKEN...); las demás usan SPOTIFY_<CUENTA>_
+DEFAULT_ACCOUNT = 'default'
+ACCOUNT_NAME_PATTERN = re.compile(r'^[a-z0-9_]+$')
+SCOPE = 'user-read-playback-state user-modify-playback-state user-read-currently-playing user-top-read user-library-read playlist-read-private playlist-modify-public playlist-modify-private'
 
 def get_authorization_url():
     """Genera la URL de autorización de Spotify"""
@@ -24,16 +30,28 @@ def get_authorization_url():
     auth_url = f"https://accounts.spotify.com/authorize?{urlencode(auth_params)}"
     return auth_url
 
-def get_access_token(auth_code):
-    """Intercambia el código de autorización por un access token"""
-    # Crear las credenciales en base64
+# Varias cuentas pueden renovar su token a la vez: las escrituras a .env se serializan
+env_file_lock = threading.Lock()
+
+def env_prefix(account=None):
+    """Prefijo de las variables de .env de la cuenta (SPOTIFY_ o SPOTIFY_<CUENTA>_)"""
+    if not account or account == DEFAULT_ACCOUNT:
+        return 'SPOTIFY_'
+    return f"SPOTIFY_{account.upper()}_"
+
+def get_client_headers():
+    """Cabeceras con las credenciales de la app en base64"""
     credentials = f"{CLIENT_ID}:{CLIENT_SECRET}"
     credentials_b64 = base64.b64encode(credentials.encode()).decode()
     
-    headers = {
+    return {
         'Authorization': f'Basic {credentials_b64}',
         'Content-Type': 'application/x-www-form-urlencoded'
     }
+
+def get_access_token(auth_code):
+    """Intercambia el código de autorización por un access token"""
+    headers = get_client_headers()
     
     data = {
         'grant_type': 'authorization_code',
@@ -41,7 +59,8 @@ def get_access_token(auth_code):
         'redirect_uri': REDIRECT_URI
     }
     
-    response = requests.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
+    import requests
+    response = requests.post(TOKEN_URL, headers=headers, data=data)
     
     if response.status_code == 200:
         token_data = response.json()
@@ -51,9 +70,148 @@ def get_access_token(auth_code):
         print(response.text)
         return None
 
-def authorize_spotify():
+def refresh_access_token(refresh_token):
+    """Obtiene un nuevo access token a partir del refresh token"""
+    data = {
+        'grant_type': 'refresh_token',
+        'refresh_token': refresh_token
+    }
+    
+    import requests
+    response = requests.post(TOKEN_URL, headers=get_client_headers(), data=data, timeout=10)
+    
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+def update_env_file(values, env_path=None):
+    """Actualiza o agrega variables en el archivo .env"""
+    env_path = env_path or find_dotenv() or '.env'
+    with env_file_lock:
+        return write_env_values(values, env_path)
+
+def write_env_values(values, env_path):
+    env_lines = []
+    
+    # Leer líneas existentes si el archivo existe
+    if os.path.exists(env_path):
+        with open(env_path, 'r', encoding='utf-8') as f:
+            env_lines = f.readlines()
+    
+    for key, value in values.items():
+        # Buscar si ya existe la variable y actualizarla o agregarla
+        new_line = f"{key}={value}\n"
+        for i, line in enumerate(env_lines):
+            if line.startswith(f'{key}='):
+                env_lines[i] = new_line
+                break
+        else:
+            # Si no existía, agregarla al final
+            if env_lines and not env_lines[-1].endswith('\n'):
+                env_lines[-1] += '\n'
+            env_lines.append(new_line)
+    
+    # Escribir el archivo .env actualizado
+    with open(env_path, 'w', encoding='utf-8') as f:
+        f.writelines(env_lines)
+    
+    return env_path
+
+def save_tokens(token_data, env_path=None, prefix='SPOTIFY_'):
+    """Guarda access token, refresh token y fecha de expiración en .env"""
+    values = {f'{prefix}ACCESS_TOKEN': token_data['access_token']}
+    if token_data.get('refresh_token'):
+        values[f'{prefix}REFRESH_TOKEN'] = token_data['refresh_token']
+    if token_data.get('expires_in'):
+        values[f'{prefix}TOKEN_EXPIRES_AT'] = str(int(time.time() + int(token_data['expires_in'])))
+    return update_env_file(values, env_path)
+
+class TokenManager:
+    """Mantiene un access token vigente renovándolo con el refresh token antes de que expire"""
+    
+    # Renovar cuando falten menos de estos segundos para la expiración
+    REFRESH_MARGIN = 60
+    
+    def __init__(self, access_token=None, refresh_token=None, expires_at=None, persist=True, prefix='SPOTIFY_'):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.persist = persist
+        # Prefijo de las variables de .env donde se guardan los tokens renovados
+        self.prefix = prefix
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, account=None):
+        """Crea el manager con los tokens de la cuenta guardados en .env"""
+        prefix = env_prefix(account)
+        expires_at = os.getenv(f'{prefix}TOKEN_EXPIRES_AT')
+        return cls(
+            access_token=os.getenv(f'{prefix}ACCESS_TOKEN'),
+            refresh_token=os.getenv(f'{prefix}REFRESH_TOKEN'),
+            expires_at=float(expires_at) if expires_at else None,
+            prefix=prefix
+        )
+    
+    def has_credentials(self):
+        return bool(self.access_token or self.refresh_token)
+    
+    def _expiring(self):
+        if not self.access_token:
+            return True
+        return self.expires_at is not None and time.time() >= self.expires_at - self.REFRESH_MARGIN
+    
+    def get_token(self):
+        """Devuelve un access token vigente, renovándolo si está por expirar"""
+        if self.refresh_token and self._expiring():
+            return self.refresh(stale_token=self.access_token)
+        return self.access_token
+    
+    def refresh(self, stale_token=None):
+        """Renueva el token; las renovaciones concurrentes se resuelven con una sola request
+        
+        stale_token es el token que el llamador vio fallar: si otro hilo ya lo reemplazó,
+        se devuelve el nuevo sin volver a llamar a Spotify.
+        """
+        with self._lock:
+            if self.access_token != stale_token and not self._expiring():
+                return self.access_token
+            if not self.refresh_token:
+                return self.access_token
+            
+            token_data = refresh_access_token(self.refresh_token)
+            if not token_data:
+                return self.access_token
+            
+            self.access_token = token_data['access_token']
+            # Spotify puede rotar el refresh token
+            self.refresh_token = token_data.get('refresh_token') or self.refresh_token
+            if token_data.get('expires_in'):
+                self.expires_at = time.time() + int(token_data['expires_in'])
+            
+            if self.persist:
+                try:
+                    save_tokens(dict(token_data, refresh_token=self.refresh_token), prefix=self.prefix)
+                except OSError:
+                    # No poder escribir .env no debe romper la llamada en curso
+                    pass
+            
+            return self.access_token
+
+def add_account_to_env(account, env_path):
+    """Agrega la cuenta a SPOTIFY_ACCOUNTS (conservando la cuenta por defecto si ya tenía tokens)"""
+    names = [n.strip().lower() for n in os.getenv('SPOTIFY_ACCOUNTS', '').split(',') if n.strip()]
+    if not names and (os.getenv('SPOTIFY_ACCESS_TOKEN') or os.getenv('SPOTIFY_REFRESH_TOKEN')):
+        names = [DEFAULT_ACCOUNT]
+    if account not in names:
+        names.append(account)
+        update_env_file({'SPOTIFY_ACCOUNTS': ','.join(names)}, env_path)
+
+def authorize_spotify(account=DEFAULT_ACCOUNT):
     """Flujo completo de autorización"""
     print("=== Autorización de Spotify ===")
+    if account != DEFAULT_ACCOUNT:
+        print(f"Cuenta: {account}")
     
     # Generar y mostrar URL de autorización
     auth_url = get_authorization_url()
@@ -63,6 +221,7 @@ def authorize_spotify():
     
     # Abrir navegador automáticamente
     try:
+        import webbrowser
         webbrowser.open(auth_url)
         print("✓Navegador abierto automáticamente")
     except:
@@ -95,37 +254,13 @@ def authorize_spotify():
             print(" Access token obtenido exitosamente!")
             print(f"Token expira en: {token_data.get('expires_in', 'N/A')} segundos")
             
-            # Guardar token en .env
-            access_token = token_data['access_token']
-            
-            # Leer el archivo .env actual
-            env_path = '.env'
-            env_lines = []
-            
-            # Leer líneas existentes si el archivo existe
-            if os.path.exists(env_path):
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    env_lines = f.readlines()
-            
-            # Buscar si ya existe SPOTIFY_ACCESS_TOKEN y actualizarlo o agregarlo
-            token_line = f"\nSPOTIFY_ACCESS_TOKEN={access_token}\n"
-            updated = False
-            
-            for i, line in enumerate(env_lines):
-                if line.startswith('SPOTIFY_ACCESS_TOKEN='):
-                    env_lines[i] = token_line
-                    updated = True
-                    break
-            
-            # Si no existía, agregarlo al final
-            if not updated:
-                env_lines.append(token_line)
-            
-            # Escribir el archivo .env actualizado
-            with open(env_path, 'w', encoding='utf-8') as f:
-                f.writelines(env_lines)
+            # Guardar access token, refresh token y expiración en .env
+            prefix = env_prefix(account)
+            save_tokens(token_data, '.env', prefix)
+            if account != DEFAULT_ACCOUNT:
+                add_account_to_env(account, '.env')
             
-            print("ACCESS_TOKEN guardado en .env")
+            print(f"{prefix}ACCESS_TOKEN y {prefix}REFRESH_TOKEN guardados en .env")
             
             return token_data
         else:
@@ -137,6 +272,11 @@ def authorize_spotify():
         return None
 
 if __name__ == "__main__":
-    token_data = authorize_spotify()
+    # python spotify_auth.py [cuenta]: sin cuenta se autoriza la cuenta por defecto
+    account = sys.argv[1].strip().lower() if len(sys.argv) > 1 else DEFAULT_ACCOUNT
+    if not ACCOUNT_NAME_PATTERN.match(account):
+        print(" El nombre de la cuenta solo puede tener letras minúsculas, números y _")
+        sys.exit(1)
+    token_data = authorize_spotify(account)
     if token_data:
         print(f"Access Token: {token_data['access_token'][:50]}...")
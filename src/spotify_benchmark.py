@@ -0,0 +1,171 @@
+"""Benchmark de latencia de las herramientas MCP contra el servidor local spotify_mock_api.py
+
+Para cada herramienta reporta requests HTTP por llamada, latencia p50/p95 y throughput
+(secuencial y concurrente), de modo que las regresiones de rendimiento se vean como números.
+
+Uso:
+    python src/spotify_benchmark.py --latency-ms 50 --iterations 20 --concurrency 8
+    python src/spotify_benchmark.py --tools get_top_tracks,create_personal_release_radar --no-cache --json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+from spotify_mock_api import MockSpotifyServer, MockState
+
+# (herramienta, argumentos) que se miden por defecto; search_and_play va primero para que haya algo sonando
+SCENARIOS = (
+    ("search_and_play", {"query": "Mock Song 3-0"}),
+    ("current_track", {}),
+    ("pause_track", {}),
+    ("resume_track", {}),
+    ("next_track", {}),
+    ("previous_track", {}),
+    ("get_top_tracks", {"time_range": "medium_term", "limit": 100}),
+    ("play_top_track", {"time_range": "short_term", "limit": 50}),
+    ("create_personal_release_radar", {"weeks_back": 4, "max_tracks": 30}),
+)
+
+# Herramientas pesadas que se ejecutan menos veces
+SLOW_TOOLS = {"create_personal_release_radar"}
+
+
+def percentile(values, pct):
+    """Percentil por interpolación lineal sobre una lista de floats"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = (len(ordered) - 1) * pct / 100
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+def configure_environment(base_url, args):
+    """Apunta el cliente al mock; debe llamarse antes de importar spotify_mcp"""
+    os.environ['SPOTIFY_API_BASE_URL'] = f"{base_url}/v1"
+    os.environ['SPOTIFY_TOKEN_URL'] = f"{base_url}/api/token"
+    os.environ['SPOTIFY_ACCESS_TOKEN'] = 'mock-access-token'
+    os.environ['SPOTIFY_REFRESH_TOKEN'] = 'mock-refresh-token'
+    os.environ['SPOTIFY_TOKEN_EXPIRES_AT'] = str(int(time.time()) + 3600)
+    os.environ['SPOTIFY_CLIENT_ID'] = 'mock-client'
+    os.environ['SPOTIFY_CLIENT_SECRET'] = 'mock-secret'
+    os.environ['SPOTIFY_RATE_LIMIT'] = str(args.rate_limit)
+    os.environ['SPOTIFY_DISK_CACHE'] = ''
+    os.environ['SPOTIFY_RADAR_STATE'] = os.path.join(tempfile.mkdtemp(prefix='spotify-bench-'), 'radar_state.json')
+    if args.no_cache:
+        os.environ['SPOTIFY_CACHE_SIZE'] = '0'
+
+
+async def run_scenario(spotify_mcp, state, name, arguments, iterations, concurrency):
+    """Ejecuta una herramienta secuencialmente y luego en paralelo; devuelve sus métricas"""
+    latencies = []
+    requests = []
+    errors = 0
+
+    for _ in range(iterations):
+        before = state.stats()["total"]
+        start = time.perf_counter()
+        content = await spotify_mcp.call_tool(name, dict(arguments))
+        latencies.append(time.perf_counter() - start)
+        requests.append(state.stats()["total"] - before)
+        if not json.loads(content[0].text).get("success"):
+            errors += 1
+
+    # Fase concurrente: mismas llamadas lanzadas a la vez para medir throughput
+    calls = iterations if concurrency > 1 else 0
+    concurrent_elapsed = 0.0
+    if calls:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                return await spotify_mcp.call_tool(name, dict(arguments))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(call() for _ in range(calls)))
+        concurrent_elapsed = time.perf_counter() - start
+        errors += sum(1 for r in results if not json.loads(r[0].text).get("success"))
+
+    sequential_elapsed = sum(latencies)
+    return {
+        "tool": name,
+        "calls": iterations + calls,
+        "errors": errors,
+        "requests_first": requests[0] if requests else 0,
+        "requests_avg": sum(requests) / len(requests) if requests else 0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0,
+        "seq_per_s": iterations / sequential_elapsed if sequential_elapsed else 0,
+        "conc_per_s": calls / concurrent_elapsed if concurrent_elapsed else 0,
+    }
+
+
+def print_table(results):
+    headers = ("tool", "calls", "errors", "requests_first", "requests_avg", "p50_ms", "p95_ms", "max_ms", "seq_per_s", "conc_per_s")
+    rows = [[r["tool"], str(r["calls"]), str(r["errors"])] + [f"{r[h]:.1f}" for h in headers[3:]] for r in results]
+    widths = [max(len(h), *(len(row[i]) for row in rows)) for i, h in enumerate(headers)]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(w) if i == 0 else value.rjust(w) for i, (value, w) in enumerate(zip(row, widths))))
+
+
+async def run_benchmark(args):
+    state = MockState(args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.error_rate, seed=args.seed)
+    server = MockSpotifyServer(('127.0.0.1', 0), state)
+    configure_environment(server.start(), args)
+
+    import spotify_mcp
+
+    selected = set(args.tools.split(',')) if args.tools else None
+    results = []
+    try:
+        for name, arguments in SCENARIOS:
+            if selected is not None and name not in selected:
+                continue
+            iterations = args.slow_iterations if name in SLOW_TOOLS else args.iterations
+            results.append(await run_scenario(spotify_mcp, state, name, arguments, iterations, args.concurrency))
+    finally:
+        spotify_mcp.accounts.close()
+        spotify_mcp.tool_executor.shutdown(wait=False, cancel_futures=True)
+        server.shutdown()
+        server.server_close()
+
+    return {"config": vars(args), "results": results, "mock_requests": state.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las herramientas MCP contra la API simulada")
+    parser.add_argument('--tools', help="Lista separada por comas de herramientas a medir (por defecto todas)")
+    parser.add_argument('--iterations', type=int, default=20, help="Llamadas secuenciales por herramienta")
+    parser.add_argument('--slow-iterations', type=int, default=3, help="Llamadas del Release Radar")
+    parser.add_argument('--concurrency', type=int, default=4, help="Llamadas simultáneas en la fase concurrente (1 la omite)")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Latencia simulada por request")
+    parser.add_argument('--jitter-ms', type=float, default=5)
+    parser.add_argument('--rate-429', type=float, default=0, help="Probabilidad de 429 del mock")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--error-rate', type=float, default=0, help="Probabilidad de 503 del mock")
+    parser.add_argument('--rate-limit', type=float, default=0, help="SPOTIFY_RATE_LIMIT del cliente (0 lo desactiva)")
+    parser.add_argument('--no-cache', action='store_true', help="Desactiva la caché de respuestas del cliente")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Imprime el resultado como JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report["results"])
+        print(f"\nRequests al mock: {report['mock_requests']['total']}")
+        for endpoint, count in sorted(report['mock_requests']['endpoints'].items(), key=lambda e: -e[1]):
+            print(f"  {count:6d}  {endpoint}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
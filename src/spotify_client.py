@@ -0,0 +1,779 @@
+import os
+import re
+import time
+import random
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from spotify_disk_cache import DiskCache
+from spotify_metrics import metrics
+
+load_dotenv()
+
+API_BASE_URL = os.getenv('SPOTIFY_API_BASE_URL', 'https://api.spotify.com/v1')
+
+# Configuración del pool de conexiones (se puede sobreescribir en .env)
+POOL_CONNECTIONS = int(os.getenv('SPOTIFY_HTTP_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.getenv('SPOTIFY_HTTP_POOL_MAXSIZE', '16'))
+POOL_BLOCK = os.getenv('SPOTIFY_HTTP_POOL_BLOCK', 'true').lower() in ('1', 'true', 'yes')
+REQUEST_TIMEOUT = float(os.getenv('SPOTIFY_HTTP_TIMEOUT', '10'))
+
+# Límite global de requests por segundo (token bucket) y ráfaga máxima
+RATE_LIMIT_PER_SECOND = float(os.getenv('SPOTIFY_RATE_LIMIT', '10'))
+RATE_LIMIT_BURST = int(os.getenv('SPOTIFY_RATE_LIMIT_BURST', '20'))
+
+# Reintentos automáticos ante 429 (respetando Retry-After) y errores 5xx
+MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', '3'))
+BACKOFF_BASE = float(os.getenv('SPOTIFY_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('SPOTIFY_BACKOFF_MAX', '30'))
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+
+# Caché en memoria de respuestas GET de solo lectura (número máximo de entradas, 0 la desactiva)
+CACHE_MAX_ENTRIES = int(os.getenv('SPOTIFY_CACHE_SIZE', '256'))
+
+# TTL en segundos por endpoint y si es catálogo. Los datos del usuario y del catálogo cambian
+# en horas o días; dispositivos y reproducción actual nunca se cachean. Solo el catálogo
+# (igual para todos los usuarios) se persiste en disco y se comparte entre cuentas.
+# /search no va aquí: search_track la recuerda en SearchCache con sus propios TTL.
+CACHE_TTLS = (
+    (re.compile(r'^/me$'), 24 * 3600, False),
+    (re.compile(r'^/me/top/(tracks|artists)$'), 3600, False),
+    (re.compile(r'^/me/following$'), 600, False),
+    (re.compile(r'^/artists/[^/]+/albums$'), 3600, True),
+    (re.compile(r'^/albums(/[^/]+/tracks)?$'), 24 * 3600, True),
+)
+
+# Caché en disco opcional (SQLite) para el catálogo: ruta del archivo y tamaño máximo en MB
+DISK_CACHE_PATH = os.getenv('SPOTIFY_DISK_CACHE')
+DISK_CACHE_MAX_MB = float(os.getenv('SPOTIFY_DISK_CACHE_MAX_MB', '64'))
+
+# Máximo de URIs por request que aceptan los endpoints de items de playlist
+PLAYLIST_CHUNK_SIZE = 100
+
+# Segundos durante los que current_track responde con el estado local del reproductor sin consultar a Spotify
+PLAYER_STATE_MAX_AGE = float(os.getenv('SPOTIFY_PLAYER_STATE_MAX_AGE', '15'))
+
+# GETs idénticos simultáneos comparten una sola request en vuelo (single-flight)
+SINGLE_FLIGHT = os.getenv('SPOTIFY_SINGLE_FLIGHT', 'true').lower() in ('1', 'true', 'yes')
+
+# Segundos que se reutiliza el dispositivo activo antes de volver a consultarlo
+DEVICE_CACHE_TTL = float(os.getenv('SPOTIFY_DEVICE_CACHE_TTL', '60'))
+
+
+class RateLimiter:
+    """Token bucket compartido por todos los hilos que hablan con la API de Spotify"""
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta que haya un token disponible"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    # Un Retry-After se respeta aunque el límite propio esté desactivado
+                    wait = self._blocked_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                    self._updated_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def block_for(self, seconds):
+        """Detiene todas las requests durante el tiempo indicado por Retry-After"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            # El bucket se rellena desde el fin del bloqueo: sin ráfaga acumulada tras el Retry-After
+            self._updated_at = self._blocked_until
+
+
+# Limitador de todo el proceso: el límite de Spotify se aplica por aplicación, no por request
+rate_limiter = RateLimiter()
+
+# Limitador adicional del trabajo en segundo plano en curso (p. ej. la carga del índice de la biblioteca):
+# sus requests pasan primero por él y no se llevan todo el cupo que usan las herramientas
+background_limiter = contextvars.ContextVar('spotify_background_limiter', default=None)
+
+
+class LimiterChain:
+    """Varios token buckets que deben dar paso en orden, p. ej. el de una cuenta y el de la aplicación"""
+
+    def __init__(self, *limiters):
+        self.limiters = limiters
+
+    def acquire(self):
+        for limiter in self.limiters:
+            limiter.acquire()
+
+    def block_for(self, seconds):
+        for limiter in self.limiters:
+            limiter.block_for(seconds)
+
+
+class SpotifyAPIError(Exception):
+    """Respuesta de error de la API dentro de un recorrido paginado"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+        self.status_code = response.status_code
+
+
+def retry_after_seconds(response):
+    """Lee la cabecera Retry-After (en segundos) de una respuesta 429"""
+    try:
+        return max(0.0, float(response.headers.get('Retry-After', '')))
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CacheEntry:
+    """Respuesta guardada en la caché"""
+
+    __slots__ = ('status_code', 'content', 'headers', 'etag', 'expires_at')
+
+    def __init__(self, content, content_type, etag, ttl, status_code=200):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'Content-Type': content_type or 'application/json'}
+        if etag:
+            self.headers['ETag'] = etag
+        self.etag = etag
+        self.expires_at = time.monotonic() + ttl
+
+    @classmethod
+    def from_response(cls, response, ttl):
+        return cls(response.content, response.headers.get('Content-Type'), response.headers.get('ETag'), ttl,
+                   response.status_code)
+
+    def is_fresh(self):
+        return time.monotonic() < self.expires_at
+
+    def to_response(self, url):
+        """Reconstruye un requests.Response equivalente al original"""
+        import requests
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = self.content
+        response.headers.update(self.headers)
+        response.encoding = 'utf-8'
+        response.url = url
+        return response
+
+
+def clone_response(response):
+    """Copia independiente de una respuesta ya descargada (status, cabeceras y contenido)"""
+    import requests
+    clone = requests.Response()
+    clone.status_code = response.status_code
+    clone._content = response.content
+    clone.headers = response.headers.copy()
+    clone.encoding = response.encoding
+    clone.reason = response.reason
+    clone.url = response.url
+    return clone
+
+
+class InFlightCall:
+    __slots__ = ('done', 'response', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SingleFlight:
+    """Agrupa GETs idénticos simultáneos: solo el primero va a la red y el resto espera su respuesta"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, func):
+        """Ejecuta func (o espera la ejecución en curso con la misma clave); devuelve (response, compartida)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = InFlightCall()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Cada llamador recibe su propia copia de la respuesta
+            return clone_response(call.response), True
+
+        try:
+            call.response = func()
+            return call.response, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Se retira antes de despertar a los demás: una request posterior vuelve a ir a la red
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class ResponseCache:
+    """Caché LRU con TTL por endpoint y revalidación por ETag para GETs de solo lectura
+
+    Si se configura un store en disco, las entradas del catálogo también se guardan allí
+    y se recuperan tras reiniciar el servidor.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttls=CACHE_TTLS, store=None):
+        self.max_entries = max_entries
+        self.ttls = ttls
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.disk_hits = 0
+
+    def policy_for(self, path):
+        """(ttl, es catálogo) del endpoint o None si no se debe cachear"""
+        if self.max_entries <= 0:
+            return None
+        for pattern, ttl, catalog in self.ttls:
+            if pattern.match(path):
+                return ttl, catalog
+        return None
+
+    @staticmethod
+    def make_key(url, params):
+        return (url, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+
+    @staticmethod
+    def _store_key(key):
+        url, params = key
+        return url + '?' + '&'.join(f'{k}={v}' for k, v in params)
+
+    def get(self, key, persistent=False):
+        """Devuelve la entrada (fresca o vencida) y la marca como usada recientemente"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if not persistent:
+            return None
+
+        row = self.store.get(self._store_key(key))
+        if row is None:
+            return None
+
+        content, content_type, etag, expires_at = row
+        entry = CacheEntry(content, content_type, etag, expires_at - time.time())
+        if entry.is_fresh():
+            with self._lock:
+                self.disk_hits += 1
+        self._insert(key, entry)
+        return entry
+
+    def _insert(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, response, ttl, persistent=False):
+        entry = CacheEntry.from_response(response, ttl)
+        self._insert(key, entry)
+        if persistent:
+            self.store.put(self._store_key(key), entry.content, entry.headers['Content-Type'], entry.etag,
+                           time.time() + ttl)
+
+    def touch(self, key, ttl, persistent=False):
+        """Renueva el TTL de una entrada revalidada con 304 Not Modified"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = time.monotonic() + ttl
+            self.revalidations += 1
+        if persistent:
+            self.store.touch(self._store_key(key), time.time() + ttl)
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations
+            }
+        if self.store is not None:
+            stats["disk_hits"] = self.disk_hits
+            stats["disk"] = self.store.size()
+        return stats
+
+
+class DeviceCache:
+    """Caché del ID del dispositivo activo con TTL corto"""
+
+    def __init__(self, ttl=DEVICE_CACHE_TTL):
+        self.ttl = ttl
+        self._device_id = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Devuelve el dispositivo en caché o None si expiró"""
+        with self._lock:
+            if self._device_id and time.monotonic() < self._expires_at:
+                return self._device_id
+            return None
+
+    def set(self, device_id):
+        with self._lock:
+            self._device_id = device_id
+            self._expires_at = time.monotonic() + self.ttl if device_id else 0.0
+
+    def invalidate(self):
+        self.set(None)
+
+
+class PlayerState:
+    """Modelo local del reproductor (dispositivo, canción, progreso, shuffle y repeat) poblado desde /me/player
+
+    Los comandos de reproducción lo actualizan de forma optimista y el progreso se extrapola
+    localmente. La edad se cuenta desde la última lectura real de /me/player.
+    """
+
+    def __init__(self, max_age=PLAYER_STATE_MAX_AGE):
+        self.max_age = max_age
+        self._state = None
+        self._observed_at = 0.0
+        self._progress_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, data):
+        """Reemplaza el modelo con una respuesta de /me/player"""
+        state = {
+            "device": data.get('device'),
+            "item": data.get('item'),
+            "is_playing": bool(data.get('is_playing')),
+            "progress_ms": data.get('progress_ms') or 0,
+            "shuffle_state": data.get('shuffle_state'),
+            "repeat_state": data.get('repeat_state')
+        }
+        with self._lock:
+            self._state = state
+            self._observed_at = self._progress_at = time.monotonic()
+
+    def snapshot(self, max_age=None):
+        """Copia del estado con el progreso extrapolado, o None si es más viejo que max_age o ya no es fiable"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state is None or now - self._observed_at > (self.max_age if max_age is None else max_age):
+                return None
+            state = dict(self._state)
+            elapsed_ms = int((now - self._progress_at) * 1000)
+            age = now - self._observed_at
+
+        item = state["item"]
+        if state["is_playing"] and item:
+            progress_ms = state["progress_ms"] + elapsed_ms
+            if item.get('duration_ms') and progress_ms >= item['duration_ms']:
+                # La canción ya terminó: no se sabe cuál sigue
+                return None
+            state["progress_ms"] = progress_ms
+        state["age_seconds"] = round(age, 1)
+        return state
+
+    def _rebase(self, now):
+        """Consolida el progreso extrapolado hasta ahora antes de un cambio optimista"""
+        if self._state["is_playing"]:
+            self._state["progress_ms"] += int((now - self._progress_at) * 1000)
+        self._progress_at = now
+
+    def set_playing(self, is_playing):
+        with self._lock:
+            if self._state is None:
+                return
+            self._rebase(time.monotonic())
+            self._state["is_playing"] = is_playing
+
+    def set_track(self, item, device_id=None, position_ms=0):
+        """Canción que se acaba de mandar a reproducir"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state is None:
+                self._state = {"device": {"id": device_id} if device_id else None,
+                               "shuffle_state": None, "repeat_state": None}
+                self._observed_at = now
+            self._state.update(item=item, is_playing=True, progress_ms=position_ms)
+            self._progress_at = now
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+
+# El catálogo es igual para todos los clientes del proceso: una sola caché en disco compartida
+disk_cache = DiskCache(DISK_CACHE_PATH, int(DISK_CACHE_MAX_MB * 1024 * 1024)) if DISK_CACHE_PATH else None
+
+
+class ConnectionPool:
+    """Sesión de requests con conexiones keep-alive, creada en el primer uso: requests no se importa al arrancar
+
+    Varios clientes (una por cuenta) pueden compartirla: el token va en cada request, no en la sesión.
+    """
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # pool_connections = número de hosts en caché, pool_maxsize = conexiones por host.
+        # Con pool_block=True nunca se abren más de pool_maxsize conexiones al mismo host.
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'Content-Type': 'application/json'})
+        return session
+
+    def close(self):
+        """Cierra las conexiones abiertas del pool"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class SpotifyClient:
+    """Cliente HTTP compartido para la Web API de Spotify con conexiones keep-alive"""
+
+    def __init__(self, tokens, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 pool_block=POOL_BLOCK, timeout=REQUEST_TIMEOUT, base_url=API_BASE_URL,
+                 limiter=None, max_retries=MAX_RETRIES, connections=None, catalog_cache=None):
+        # TokenManager de spotify_auth: entrega y renueva el access token
+        self.tokens = tokens
+        self.timeout = timeout
+        self.limiter = limiter or rate_limiter
+        self.max_retries = max_retries
+        self.base_url = base_url.rstrip('/')
+        self.devices = DeviceCache()
+        self.player = PlayerState()
+        self.cache = ResponseCache(store=disk_cache)
+        # Respuestas del catálogo: por defecto en la misma caché; con varias cuentas, en una compartida
+        self.catalog_cache = catalog_cache or self.cache
+        self.in_flight = SingleFlight() if SINGLE_FLIGHT else None
+        self.connections = connections or ConnectionPool(pool_connections, pool_maxsize, pool_block)
+
+    @property
+    def session(self):
+        return self.connections.session
+
+    def _path(self, path):
+        """Path relativo a la API (sin host) para decidir la política de caché"""
+        if path.startswith(self.base_url):
+            return path[len(self.base_url):].split('?', 1)[0]
+        return path
+
+    def _url(self, path):
+        """Construye la URL completa a partir de un path relativo de la API"""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}{path}"
+
+    def _send(self, method, url, token, params=None, json=None, headers=None, timeout=None):
+        """Envía una sola request autenticada reutilizando las conexiones del pool"""
+        request_headers = {'Authorization': f'Bearer {token}'}
+        if headers:
+            request_headers.update(headers)
+
+        return self.session.request(
+            method,
+            url,
+            params=params,
+            json=json,
+            headers=request_headers,
+            timeout=timeout or self.timeout
+        )
+
+    def _acquire(self):
+        """Turno en el limitador del trabajo en segundo plano (si la request viene de ahí) y en el del cliente"""
+        background = background_limiter.get()
+        if background is not None:
+            background.acquire()
+        self.limiter.acquire()
+
+    def _send_instrumented(self, method, url, token, retry, **kwargs):
+        """Como acquire + _send, pero registra la espera del rate limiter, la latencia y el status"""
+        started = time.perf_counter()
+        self._acquire()
+        sent = time.perf_counter()
+        metrics.record_wait('rate_limit', sent - started)
+        path = self._path(url)
+        try:
+            response = self._send(method, url, token, **kwargs)
+        except Exception:
+            # Error de red (requests.RequestException): sin status HTTP
+            metrics.record_request(method, path, 'error', time.perf_counter() - sent, retry)
+            raise
+        metrics.record_request(method, path, response.status_code, time.perf_counter() - sent, retry)
+        return response
+
+    def _retry_delay(self, method, response, attempt):
+        """Segundos a esperar antes de reintentar, o None si la respuesta es definitiva"""
+        if response.status_code == 429:
+            # Spotify no procesó la request: se puede reintentar cualquier método
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            elif delay > BACKOFF_MAX:
+                # Una espera tan larga no cabe en una llamada a herramienta: devolver el 429, pero
+                # frenar a los demás hilos (hasta BACKOFF_MAX) para no seguir golpeando a Spotify
+                self.limiter.block_for(BACKOFF_MAX)
+                return None
+            self.limiter.block_for(delay)
+            return delay + random.uniform(0, BACKOFF_BASE)
+        if response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS:
+            return backoff_delay(attempt)
+        return None
+
+    def _request_with_retries(self, method, url, params=None, json=None, headers=None, timeout=None):
+        """Ejecuta una request respetando el rate limit, renovando el token y reintentando 429/5xx"""
+        attempt = 0
+        token_refreshed = False
+        while True:
+            token = self.tokens.get_token()
+            if metrics.enabled:
+                response = self._send_instrumented(method, url, token, attempt > 0 or token_refreshed,
+                                                   params=params, json=json, headers=headers, timeout=timeout)
+            else:
+                self._acquire()
+                response = self._send(method, url, token, params=params, json=json, headers=headers, timeout=timeout)
+
+            if response.status_code == 401 and not token_refreshed:
+                # Token expirado: renovarlo (una sola vez) y repetir la request de forma transparente
+                token_refreshed = True
+                if self.tokens.refresh(stale_token=token) != token:
+                    continue
+
+            delay = self._retry_delay(method, response, attempt)
+            if delay is None or attempt >= self.max_retries:
+                return response
+            if metrics.enabled:
+                metrics.record_wait('retry', delay)
+            time.sleep(delay)
+            attempt += 1
+
+    def _fetch(self, method, url, params=None, json=None, headers=None, timeout=None):
+        """_request_with_retries compartiendo los GETs idénticos que ya estén en vuelo"""
+        if method != 'GET' or self.in_flight is None:
+            return self._request_with_retries(method, url, params, json, headers, timeout)
+
+        key = (url, ResponseCache.make_key(url, params)[1], tuple(sorted((headers or {}).items())))
+        response, shared = self.in_flight.do(
+            key, lambda: self._request_with_retries(method, url, params, json, headers, timeout)
+        )
+        if shared and metrics.enabled:
+            metrics.record_shared(self._path(url))
+        return response
+
+    def request(self, method, path, params=None, json=None, headers=None, timeout=None):
+        """Ejecuta una request contra la API, sirviendo desde caché los GETs de solo lectura"""
+        method = method.upper()
+        url = self._url(path)
+
+        policy = self.cache.policy_for(self._path(path)) if method == 'GET' else None
+        if policy is None:
+            return self._fetch(method, url, params, json, headers, timeout)
+
+        ttl, catalog = policy
+        cache = self.catalog_cache if catalog else self.cache
+        persistent = catalog and cache.store is not None
+        key = cache.make_key(url, params)
+        entry = cache.get(key, persistent)
+        if entry is not None and entry.is_fresh():
+            cache.record(hit=True)
+            if metrics.enabled:
+                metrics.record_cache(self._path(path), 'hit')
+            return entry.to_response(url)
+
+        # Entrada vencida con ETag: revalidar con If-None-Match en lugar de descargar de nuevo
+        if entry is not None and entry.etag:
+            headers = dict(headers or {}, **{'If-None-Match': entry.etag})
+
+        cache.record(hit=False)
+        response = self._fetch(method, url, params, json, headers, timeout)
+        revalidated = response.status_code == 304 and entry is not None
+        if metrics.enabled:
+            metrics.record_cache(self._path(path), 'revalidated' if revalidated else 'miss')
+
+        if revalidated:
+            cache.touch(key, ttl, persistent)
+            return entry.to_response(url)
+        if response.status_code == 200:
+            cache.put(key, response, ttl, persistent)
+        return response
+
+    def get(self, path, params=None, **kwargs):
+        return self.request('GET', path, params=params, **kwargs)
+
+    def post(self, path, params=None, json=None, **kwargs):
+        return self.request('POST', path, params=params, json=json, **kwargs)
+
+    def put(self, path, params=None, json=None, **kwargs):
+        return self.request('PUT', path, params=params, json=json, **kwargs)
+
+    def delete(self, path, params=None, json=None, **kwargs):
+        return self.request('DELETE', path, params=params, json=json, **kwargs)
+
+    def _fetch_page(self, path, params, container):
+        response = self.get(path, params=params)
+        if response.status_code != 200:
+            raise SpotifyAPIError(response)
+        data = response.json()
+        return (data.get(container) or {}) if container else data
+
+    def paginate(self, path, params=None, container=None, max_items=None, prefetch=True):
+        """Recorre un endpoint paginado (offset o cursor) devolviendo una lista de items por página
+
+        Es un generador: las páginas se piden a medida que se consumen y, mientras el
+        llamador procesa una, la siguiente ya se está descargando. container es la clave
+        que envuelve la página en endpoints como /me/following ('artists'). Con prefetch=False
+        la siguiente página solo se pide cuando el llamador la necesita (útil si va a cortar antes).
+        Lanza SpotifyAPIError si alguna página no responde 200.
+        """
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='spotify-prefetch') as prefetcher:
+            page = self._fetch_page(path, params, container)
+            yielded = 0
+            while page:
+                items = page.get('items') or []
+                if max_items is not None:
+                    items = items[:max_items - yielded]
+                yielded += len(items)
+
+                # Spotify devuelve la URL completa de la siguiente página (offset o cursor incluidos)
+                next_url = page.get('next')
+                pending = None
+                has_next = next_url and items and (max_items is None or yielded < max_items)
+                if has_next and prefetch:
+                    # Con el contexto del llamador, para atribuir la request a su herramienta
+                    pending = prefetcher.submit(contextvars.copy_context().run, self._fetch_page, next_url, None, container)
+
+                if items:
+                    yield items
+                if pending:
+                    page = pending.result()
+                elif has_next:
+                    page = self._fetch_page(next_url, None, container)
+                else:
+                    page = None
+
+    def close(self):
+        """Cierra las conexiones abiertas del pool"""
+        self.connections.close()
+
+
+class PlaylistWriter:
+    """Escribe listas de URIs de cualquier tamaño en una playlist, en bloques de 100 y en orden
+
+    Spotify acepta como máximo 100 URIs por request. Los bloques se envían uno tras otro
+    sobre la misma conexión keep-alive, cada uno con su posición explícita, para que el
+    orden final sea el de la lista aunque la playlist ya tenga canciones.
+    """
+
+    def __init__(self, client, playlist_id, chunk_size=PLAYLIST_CHUNK_SIZE, progress=None):
+        self.client = client
+        self.playlist_id = playlist_id
+        self.chunk_size = chunk_size
+        # progress(escritos, total) se llama después de cada bloque confirmado
+        self.progress = progress
+
+    def write(self, uris, replace=False, position=None):
+        """Agrega (o reemplaza con replace=True) las URIs; position inserta a partir de ese índice
+
+        Devuelve un resumen con los tracks escritos, aun si un bloque falla a mitad de camino.
+        """
+        path = f'/playlists/{self.playlist_id}/tracks'
+        chunks = [uris[i:i + self.chunk_size] for i in range(0, len(uris), self.chunk_size)]
+        result = {"success": True, "written": 0, "total": len(uris), "chunks": len(chunks), "snapshot_id": None}
+
+        if replace and not chunks:
+            # Vaciar la playlist
+            chunks = [[]]
+
+        for index, chunk in enumerate(chunks):
+            if replace and index == 0:
+                response = self.client.put(path, json={"uris": chunk})
+            else:
+                body = {"uris": chunk}
+                if position is not None:
+                    body["position"] = position + result["written"]
+                response = self.client.post(path, json=body)
+
+            if response.status_code not in (200, 201):
+                result.update(success=False, error=f"HTTP {response.status_code}", failed_chunk=index)
+                return result
+
+            result["written"] += len(chunk)
+            result["snapshot_id"] = response.json().get('snapshot_id', result["snapshot_id"])
+            if self.progress:
+                self.progress(result["written"], result["total"])
+
+        return result
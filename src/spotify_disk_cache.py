@@ -0,0 +1,123 @@
+import os
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    content_type TEXT,
+    etag TEXT,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+class DiskCache:
+    """Caché persistente en SQLite para metadatos del catálogo que sobrevive a reinicios del servidor
+
+    Cada hilo usa su propia conexión; SQLite (modo WAL) serializa las escrituras
+    entre hilos y entre procesos que compartan el mismo archivo.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connect(self):
+        """Conexión SQLite del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        if not self._schema_ready:
+            # El archivo se abre en el primer acceso, no al importar el cliente
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def get(self, key):
+        """Devuelve (content, content_type, etag, expires_at) o None; incluye entradas vencidas para revalidar"""
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT content, content_type, etag, expires_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            return row
+        except sqlite3.Error:
+            # Un archivo bloqueado o corrupto no debe romper la llamada: se trata como miss
+            return None
+
+    def put(self, key, content, content_type, etag, expires_at):
+        size = len(content)
+        if size > self.max_bytes:
+            return
+        try:
+            now = time.time()
+            self._connect().execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, content, content_type, etag, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, content, content_type, etag, expires_at, now, size)
+            )
+            self._evict()
+        except sqlite3.Error:
+            pass
+
+    def touch(self, key, expires_at):
+        """Extiende la expiración de una entrada revalidada"""
+        try:
+            self._connect().execute(
+                'UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?', (expires_at, time.time(), key)
+            )
+        except sqlite3.Error:
+            pass
+
+    def size(self):
+        try:
+            row = self._connect().execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses').fetchone()
+        except sqlite3.Error as e:
+            # Las estadísticas no deben fallar por un archivo bloqueado o corrupto
+            return {"error": str(e), "max_bytes": self.max_bytes}
+        return {"bytes": row[0], "entries": row[1], "max_bytes": self.max_bytes}
+
+    def _evict(self):
+        """Elimina las entradas usadas hace más tiempo hasta quedar por debajo del 90% del límite"""
+        with self._evict_lock:
+            conn = self._connect()
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            target = int(self.max_bytes * 0.9)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+                for key, size in rows:
+                    if total <= target:
+                        break
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    total -= size
+                conn.execute('COMMIT')
+            except sqlite3.Error:
+                conn.execute('ROLLBACK')
+                raise
+
+    def clear(self):
+        self._connect().execute('DELETE FROM responses')
@@ -0,0 +1,88 @@
+import io
+import os
+import csv
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Formato por defecto de las respuestas de las herramientas: json (compacto), pretty (indentado) o table
+RESPONSE_FORMATS = ('json', 'pretty', 'table')
+DEFAULT_RESPONSE_FORMAT = os.getenv('SPOTIFY_RESPONSE_FORMAT', 'json').lower()
+if DEFAULT_RESPONSE_FORMAT not in RESPONSE_FORMATS:
+    DEFAULT_RESPONSE_FORMAT = 'json'
+
+# Propiedades comunes que aceptan todas las herramientas para elegir cómo se serializa la respuesta
+OUTPUT_PROPERTIES = {
+    "format": {
+        "type": "string",
+        "description": "Response encoding: json (compact), pretty (indented JSON) or table (lists of tracks as CSV rows, fewest tokens)",
+        "enum": list(RESPONSE_FORMATS)
+    },
+    "fields": {
+        "type": "array",
+        "description": "Only keep these fields in each item of list results, e.g. [\"name\", \"artist\", \"uri\"]",
+        "items": {"type": "string"}
+    }
+}
+
+
+def parse_output_options(arguments):
+    """(formato, campos) pedidos por el llamador; lanza ValueError si no son válidos"""
+    fmt = arguments.get("format") or DEFAULT_RESPONSE_FORMAT
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError(f"format debe ser: {', '.join(RESPONSE_FORMATS)}")
+
+    fields = arguments.get("fields")
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+        raise ValueError("fields debe ser una lista de nombres de campo")
+    return fmt, fields or None
+
+
+def is_record_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def project(result, fields):
+    """Deja solo los campos pedidos en los items de las listas del resultado (los demás valores no se tocan)"""
+    projected = {}
+    for key, value in result.items():
+        if is_record_list(value):
+            value = [{f: item[f] for f in fields if f in item} for item in value]
+        projected[key] = value
+    return projected
+
+
+def to_csv(records):
+    """Lista de dicts como CSV con cabecera; los valores anidados van como JSON compacto"""
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([
+            json.dumps(v, ensure_ascii=False, separators=(',', ':')) if isinstance(v, (dict, list)) else
+            ('' if v is None else v)
+            for v in (record.get(column) for column in columns)
+        ])
+    return buffer.getvalue()
+
+
+def render(result, fmt=DEFAULT_RESPONSE_FORMAT, fields=None):
+    """Serializa el resultado de una herramienta en el formato pedido"""
+    if fields:
+        result = project(result, fields)
+
+    if fmt == 'pretty':
+        return json.dumps(result, ensure_ascii=False, indent=2)
+    if fmt == 'table':
+        tables = {key: value for key, value in result.items() if is_record_list(value)}
+        if tables:
+            rest = {key: value for key, value in result.items() if key not in tables}
+            parts = [json.dumps(rest, ensure_ascii=False, separators=(',', ':'))]
+            for key, records in tables.items():
+                parts.append(f"{key}:\n{to_csv(records)}")
+            return '\n\n'.join(parts)
+    return json.dumps(result, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,174 @@
+"""Transporte MCP streamable HTTP: un solo proceso de larga duración atiende a muchos clientes MCP
+
+Todos los clientes comparten las cuentas, cachés, conexiones con Spotify y el rate limiter del proceso.
+Por defecto solo escucha en localhost y rechaza Host/Origin ajenos (protección contra DNS rebinding).
+En otra interfaz exige un token (SPOTIFY_MCP_AUTH_TOKEN) en Authorization: Bearer; sin él no arranca.
+Se importa solo al usar --transport http: starlette y uvicorn no pesan en el arranque por stdio.
+"""
+import os
+import sys
+import hmac
+import contextlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Dirección, puerto y path del endpoint MCP
+HTTP_HOST = os.getenv('SPOTIFY_MCP_HOST', '127.0.0.1')
+HTTP_PORT = int(os.getenv('SPOTIFY_MCP_PORT', '8000'))
+HTTP_PATH = '/mcp'
+
+# Sesiones MCP abiertas a la vez y segundos sin actividad tras los que se cierra una sesión
+MAX_SESSIONS = int(os.getenv('SPOTIFY_MCP_MAX_SESSIONS', '100'))
+SESSION_IDLE_TIMEOUT = float(os.getenv('SPOTIFY_MCP_SESSION_IDLE_TIMEOUT', '1800'))
+
+# Conexiones HTTP simultáneas; por encima uvicorn responde 503 en lugar de encolar
+MAX_CONNECTIONS = int(os.getenv('SPOTIFY_MCP_MAX_CONNECTIONS', '64'))
+
+# Segundos que se espera a las requests en curso al recibir SIGINT/SIGTERM antes de cortarlas
+SHUTDOWN_TIMEOUT = int(os.getenv('SPOTIFY_MCP_SHUTDOWN_TIMEOUT', '10'))
+
+# Token que deben enviar los clientes (Authorization: Bearer <token>); obligatorio fuera de localhost
+AUTH_TOKEN = os.getenv('SPOTIFY_MCP_AUTH_TOKEN') or None
+
+LOOPBACK_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def security_settings(host):
+    """Con un host local solo se aceptan Host y Origin locales; en otra interfaz la validación queda desactivada"""
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    if host not in LOOPBACK_HOSTS:
+        return TransportSecuritySettings(enable_dns_rebinding_protection=False)
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=['127.0.0.1:*', 'localhost:*', '[::1]:*'],
+        allowed_origins=['http://127.0.0.1:*', 'http://localhost:*', 'http://[::1]:*']
+    )
+
+
+class MCPEndpoint:
+    """App ASGI del endpoint MCP: comprueba el token (si hay) y delega cada request en el gestor de sesiones"""
+
+    def __init__(self, session_manager, auth_token=None):
+        self.session_manager = session_manager
+        self.expected_authorization = f"Bearer {auth_token}".encode() if auth_token else None
+
+    def authorized(self, scope):
+        if self.expected_authorization is None:
+            return True
+        authorization = dict(scope['headers']).get(b'authorization', b'')
+        # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+        return hmac.compare_digest(authorization, self.expected_authorization)
+
+    async def __call__(self, scope, receive, send):
+        if not self.authorized(scope):
+            from starlette.responses import JSONResponse
+
+            response = JSONResponse({"error": "Token inválido o ausente"}, status_code=401,
+                                    headers={"WWW-Authenticate": "Bearer"})
+            await response(scope, receive, send)
+            return
+        await self.session_manager.handle_request(scope, receive, send)
+
+
+def create_app(server, host=HTTP_HOST, on_startup=None, max_sessions=MAX_SESSIONS,
+               session_idle_timeout=SESSION_IDLE_TIMEOUT, auth_token=AUTH_TOKEN):
+    """App Starlette con el servidor MCP en HTTP_PATH; on_startup se llama al arrancar (p. ej. precalentar)"""
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+
+    session_manager = StreamableHTTPSessionManager(
+        app=server,
+        security_settings=security_settings(host),
+        session_idle_timeout=session_idle_timeout,
+        max_sessions=max_sessions
+    )
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # Al salir se cancelan las sesiones abiertas y sus llamadas en curso
+        async with session_manager.run():
+            if on_startup is not None:
+                on_startup()
+            yield
+
+    endpoint = MCPEndpoint(session_manager, auth_token)
+    return Starlette(routes=[Route(HTTP_PATH, endpoint=endpoint)], lifespan=lifespan)
+
+
+def graceful_server(config, drain=None):
+    """uvicorn.Server con apagado en dos fases y que vuelve al llamador en lugar de re-lanzar SIGTERM
+
+    Con la primera señal se espera a drain(timeout) (las llamadas a herramientas en curso) antes de
+    apagar uvicorn, que corta de inmediato las respuestas SSE abiertas. Una segunda señal apaga ya.
+    Al volver, main() cierra las conexiones con Spotify y escribe el archivo de métricas.
+    """
+    import signal
+    import asyncio
+    import threading
+    import uvicorn
+
+    class GracefulServer(uvicorn.Server):
+        draining = False
+
+        def handle_exit(self, sig, frame):
+            if drain is None or self.draining:
+                return super().handle_exit(sig, frame)
+            self.draining = True
+            # Manejador de señal: el drenaje se agenda en el event loop
+            self.event_loop.call_soon_threadsafe(self.start_drain, sig, frame)
+
+        def start_drain(self, sig, frame):
+            self.drain_task = self.event_loop.create_task(self.drain_and_exit(sig, frame))
+
+        async def drain_and_exit(self, sig, frame):
+            await drain(self.config.timeout_graceful_shutdown)
+            super().handle_exit(sig, frame)
+
+        async def serve(self, sockets=None):
+            self.event_loop = asyncio.get_running_loop()
+            await super().serve(sockets)
+
+        @contextlib.contextmanager
+        def capture_signals(self):
+            # Como en uvicorn, pero sin volver a lanzar la señal al terminar (eso saltaría el finally de main)
+            if threading.current_thread() is not threading.main_thread():
+                yield
+                return
+            original_handlers = {sig: signal.signal(sig, self.handle_exit) for sig in (signal.SIGINT, signal.SIGTERM)}
+            try:
+                yield
+            finally:
+                for sig, handler in original_handlers.items():
+                    signal.signal(sig, handler)
+
+    return GracefulServer(config)
+
+
+async def serve_http(server, host=HTTP_HOST, port=HTTP_PORT, on_startup=None, drain=None,
+                     max_connections=MAX_CONNECTIONS, shutdown_timeout=SHUTDOWN_TIMEOUT, auth_token=AUTH_TOKEN):
+    """Sirve el servidor MCP por streamable HTTP hasta recibir SIGINT/SIGTERM
+
+    El apagado es ordenado: drain(timeout) deja de admitir llamadas y espera a las que están en
+    curso; luego se deja de aceptar conexiones y se cierran las sesiones (hasta shutdown_timeout segundos).
+    Fuera de localhost no arranca sin auth_token: cualquiera que alcance el puerto controlaría las cuentas.
+    """
+    if host not in LOOPBACK_HOSTS and not auth_token:
+        print(f" ERROR: para escuchar en {host} define SPOTIFY_MCP_AUTH_TOKEN en .env "
+              "(los clientes lo envían como Authorization: Bearer <token>)", file=sys.stderr)
+        raise SystemExit(1)
+
+    import uvicorn
+
+    config = uvicorn.Config(
+        create_app(server, host, on_startup, auth_token=auth_token),
+        host=host,
+        port=port,
+        limit_concurrency=max_connections,
+        timeout_graceful_shutdown=shutdown_timeout,
+        log_level='warning'
+    )
+    print(f"Servidor MCP escuchando en http://{host}:{port}{HTTP_PATH}", file=sys.stderr)
+    await graceful_server(config, drain).serve()
@@ -1,62 +1,213 @@
 import os
-import requests
+import re
+import random
+import asyncio
+import functools
+import itertools
+import threading
+import contextvars
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent
+from mcp.types import Tool, TextContent, InitializedNotification
+from spotify_accounts import AccountRegistry, AccountProxy, UnknownAccountError, account_property
+from spotify_client import SpotifyAPIError, PlaylistWriter, disk_cache
+from spotify_metrics import metrics
+from spotify_search import SearchCache, compact_track
+from spotify_format import OUTPUT_PROPERTIES, parse_output_options, render
+from spotify_tools import ToolRegistry, ToolArgumentError
 import json
 
 load_dotenv()
 
-ACCESS_TOKEN = os.getenv('SPOTIFY_ACCESS_TOKEN')
+# Cuentas de Spotify del servidor (SPOTIFY_ACCOUNTS); cada llamada a herramienta elige una con "account"
+accounts = AccountRegistry()
 
-def get_active_device():
+# Objetos de la cuenta en curso. Cada cuenta tiene su token (renovado antes de expirar), su cliente
+# (caché, dispositivo y reproductor) y el índice local de su biblioteca; todas comparten las conexiones
+token_manager = AccountProxy(accounts, 'tokens')
+client = AccountProxy(accounts, 'client')
+library_index = AccountProxy(accounts, 'library_index')
+
+# Resultados de búsquedas anteriores con la consulta normalizada (incluye búsquedas sin resultados).
+# /search devuelve catálogo con un mercado fijo: la memoria es común a todas las cuentas y,
+# con SPOTIFY_DISK_CACHE, se persiste junto al resto del catálogo
+search_cache = SearchCache(store=disk_cache)
+# Búsquedas de colaboraciones del Release Radar (lista de tracks por artista)
+feature_search_cache = SearchCache(store=disk_cache, namespace='features')
+
+# Mercado de las búsquedas de canciones
+SEARCH_MARKET = 'ES'
+
+# Pool acotado de workers para las llamadas bloqueantes a la API de Spotify
+TOOL_WORKERS = int(os.getenv('SPOTIFY_MCP_WORKERS', '8'))
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix='spotify-tool')
+
+# Llamadas a herramientas admitidas a la vez entre todos los clientes (ejecutándose o esperando un
+# worker); por encima se rechazan en lugar de acumular una cola sin límite
+MAX_PENDING_CALLS = int(os.getenv('SPOTIFY_MCP_MAX_PENDING_CALLS', '64'))
+pending_calls = 0
+# Pasa a False al apagar el servidor HTTP: las llamadas nuevas se rechazan mientras terminan las actuales
+accepting_calls = True
+
+# Transporte por defecto: stdio (un proceso por cliente) o http (streamable HTTP, ver spotify_http.py)
+MCP_TRANSPORTS = ('stdio', 'http')
+MCP_TRANSPORT = os.getenv('SPOTIFY_MCP_TRANSPORT', 'stdio').lower()
+
+# Tras el handshake MCP se abre la conexión con Spotify y se valida el token en segundo plano
+PREWARM = os.getenv('SPOTIFY_PREWARM', 'true').lower() in ('1', 'true', 'yes')
+
+# Si está activo, los comandos de reproducción no consultan /me/player/devices antes de enviarse
+SKIP_DEVICE_LOOKUP = os.getenv('SPOTIFY_SKIP_DEVICE_LOOKUP', 'false').lower() in ('1', 'true', 'yes')
+
+# Requests simultáneas máximas del Release Radar (no debe superar el pool de conexiones)
+RADAR_CONCURRENCY = int(os.getenv('SPOTIFY_RADAR_CONCURRENCY', '6'))
+
+# Grupos de lanzamientos que revisa el Release Radar (todos en la misma request por artista)
+ARTIST_ALBUM_GROUPS = ('album', 'single')
+
+# Estado del Release Radar incremental: playlist por usuario y último lanzamiento visto por artista
+RADAR_STATE_PATH = os.getenv(
+    'SPOTIFY_RADAR_STATE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.radar_state.json')
+)
+# Un artista revisado hace menos de estas horas no se vuelve a consultar en modo incremental
+RADAR_RECHECK_HOURS = float(os.getenv('SPOTIFY_RADAR_RECHECK_HOURS', '12'))
+# Tracks recordados por usuario para no repetirlos al agregar a la playlist existente
+RADAR_REMEMBERED_TRACKS = 2000
+# Álbumes ya incluidos que se recuerdan por artista (los más recientes)
+RADAR_REMEMBERED_ALBUMS = 50
+radar_state_lock = threading.Lock()
+
+# Máximo de IDs que acepta el endpoint /albums?ids=
+ALBUMS_BATCH_SIZE = 20
+
+# Tamaño máximo de página de los endpoints paginados y máximo de top tracks por herramienta
+PAGE_SIZE = 50
+TOP_TRACKS_MAX = 1000
+
+# Máximo de tracks que puede pedir el Release Radar expuesto como herramienta
+RADAR_MAX_TRACKS = 10000
+
+# queue_tracks: máximo de canciones por llamada y búsquedas simultáneas
+QUEUE_MAX_TRACKS = 50
+QUEUE_CONCURRENCY = 8
+TRACK_URI_PATTERN = re.compile(r'^(?:spotify:(track|episode):|https?://open\.spotify\.com/(?:intl-[a-z]+/)?(track|episode)/)([A-Za-z0-9]+)')
+
+async def run_in_worker(func, *args, **kwargs):
+    """Ejecuta una función bloqueante en el pool de workers sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    # Copia el contexto (herramienta en curso para las métricas) al hilo del worker
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(tool_executor, functools.partial(context.run, func, *args, **kwargs))
+
+def fetch_player_state():
+    """Consulta /me/player y actualiza el modelo local del reproductor y el dispositivo activo
+    
+    Devuelve (response, device_id); device_id es None si no hay reproducción activa.
+    """
+    response = client.get('/me/player')
+    if response.status_code == 200 and response.content:
+        data = response.json()
+        client.player.update(data)
+        device_id = (data.get('device') or {}).get('id')
+        client.devices.set(device_id)
+        return response, device_id
+
+    client.player.invalidate()
+    if response.status_code in (200, 204):
+        # 204: ningún dispositivo está reproduciendo
+        client.devices.invalidate()
+    return response, None
+
+def get_active_device(use_cache=True):
     """Obtiene el dispositivo activo de Spotify"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return None
+
+    if use_cache:
+        device_id = client.devices.get()
+        if device_id:
+            return device_id
         
-    headers = {
-        'Authorization': f'Bearer {ACCESS_TOKEN}',
-        'Content-Type': 'application/json'
-    }
-    
     try:
-        response = requests.get('https://api.spotify.com/v1/me/player/devices', headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            devices = response.json()['devices']
-            for device in devices:
-                if device.get('is_active'):
-                    return device['id']
-            return None
-        else:
-            return None
+        # /me/player trae el dispositivo y además deja el estado del reproductor listo para current_track
+        response, device_id = fetch_player_state()
+        return device_id
     except Exception:
         return None
 
+def is_no_device_error(response):
+    """Indica si la respuesta de Spotify significa que el dispositivo ya no está activo"""
+    if response.status_code == 404:
+        return True
+    if response.status_code < 400:
+        return False
+    try:
+        reason = response.json().get('error', {}).get('reason')
+    except (ValueError, AttributeError):
+        return False
+    return reason == 'NO_ACTIVE_DEVICE'
+
+def send_player_command(method, path, json=None, params=None):
+    """Envía un comando de reproducción al dispositivo activo (en caché) y reintenta una vez si cambió
+    
+    Devuelve (response, device_id). Si no hay dispositivo activo devuelve (None, None).
+    """
+    if SKIP_DEVICE_LOOKUP:
+        # Sin device_id Spotify usa su dispositivo activo actual, sin consulta previa
+        device_id = client.devices.get()
+    else:
+        device_id = get_active_device()
+        if not device_id:
+            return None, None
+
+    extra_params = params or {}
+    params = dict(extra_params, device_id=device_id) if device_id else (extra_params or None)
+    response = client.request(method, path, params=params, json=json)
+
+    if is_no_device_error(response):
+        # El dispositivo en caché ya no sirve: buscar uno nuevo y reintentar una sola vez
+        client.devices.invalidate()
+        device_id = get_active_device(use_cache=False)
+        if not device_id:
+            return None, None
+        response = client.request(method, path, params=dict(extra_params, device_id=device_id), json=json)
+        if is_no_device_error(response):
+            client.devices.invalidate()
+
+    apply_player_command(path, json, response)
+    return response, device_id
+
+def apply_player_command(path, json, response):
+    """Actualiza el modelo local del reproductor de forma optimista tras un comando aceptado"""
+    if response.status_code >= 300:
+        client.player.invalidate()
+    elif path == '/me/player/pause':
+        client.player.set_playing(False)
+    elif path == '/me/player/play' and not json:
+        client.player.set_playing(True)
+    elif path == '/me/player/queue':
+        # Agregar a la cola no cambia lo que suena
+        pass
+    else:
+        # next/previous (o play con URIs, que fija el llamador): la canción nueva es desconocida
+        client.player.invalidate()
+
 def next_track():
     """Saltar a la siguiente canción en el dispositivo activo"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        device_id = get_active_device()
-        if not device_id:
-            return {"success": False, "error": "No hay dispositivo activo encontrado"}
-        
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
         # Hacer request a next track
-        response = requests.post(
-            f'https://api.spotify.com/v1/me/player/next?device_id={device_id}', 
-            headers=headers, 
-            timeout=10
-        )
+        response, device_id = send_player_command('POST', '/me/player/next')
+        if response is None:
+            return {"success": False, "error": "No hay dispositivo activo encontrado"}
         
-        if response.status_code == 200:  # 200 es el código correcto
+        if response.status_code in (200, 204):  # Spotify responde 204 (antes 200)
             return {"success": True, "action": "next_track", "device_id": device_id}
         elif response.status_code == 403:
             return {"success": False, "error": "Token expirado o permisos insuficientes"}
@@ -69,25 +220,14 @@ def next_track():
 
 def previous_track():
     """Ir a la canción anterior en el dispositivo activo"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        device_id = get_active_device()
-        if not device_id:
-            return {"success": False, "error": "No hay dispositivo activo encontrado"}
-        
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
         # Hacer request a previous track
-        response = requests.post(
-            f'https://api.spotify.com/v1/me/player/previous?device_id={device_id}', 
-            headers=headers, 
-            timeout=10
-        )
+        response, device_id = send_player_command('POST', '/me/player/previous')
+        if response is None:
+            return {"success": False, "error": "No hay dispositivo activo encontrado"}
         
         if response.status_code == 204:  # 204 es el código correcto
             return {"success": True, "action": "previous_track", "device_id": device_id}
@@ -102,25 +242,14 @@ def previous_track():
 
 def pause_track():
     """Pausar la reproducción en el dispositivo activo"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        device_id = get_active_device()
-        if not device_id:
-            return {"success": False, "error": "No hay dispositivo activo encontrado"}
-        
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
         # Hacer request a pause
-        response = requests.put(
-            f'https://api.spotify.com/v1/me/player/pause?device_id={device_id}', 
-            headers=headers, 
-            timeout=10
-        )
+        response, device_id = send_player_command('PUT', '/me/player/pause')
+        if response is None:
+            return {"success": False, "error": "No hay dispositivo activo encontrado"}
         
         if response.status_code == 204:  # 204 es el código correcto
             return {"success": True, "action": "pause", "device_id": device_id}
@@ -135,25 +264,14 @@ def pause_track():
 
 def resume_track():
     """Reanudar la reproducción en el dispositivo activo"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        device_id = get_active_device()
-        if not device_id:
-            return {"success": False, "error": "No hay dispositivo activo encontrado"}
-        
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
         # Hacer request a play/resume
-        response = requests.put(
-            f'https://api.spotify.com/v1/me/player/play?device_id={device_id}', 
-            headers=headers, 
-            timeout=10
-        )
+        response, device_id = send_player_command('PUT', '/me/player/play')
+        if response is None:
+            return {"success": False, "error": "No hay dispositivo activo encontrado"}
         
         if response.status_code == 204:  # 204 es el código correcto
             return {"success": True, "action": "resume", "device_id": device_id}
@@ -166,62 +284,62 @@ def resume_track():
     except Exception as e:
         return {"success": False, "error": f"Error de conexión: {str(e)}"}
 
+def format_ms(ms):
+    return f"{ms // 60000}:{(ms % 60000) // 1000:02d}"
+
 def current_track():
     """Obtener información de la canción que se está reproduciendo actualmente"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     try:
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        response = requests.get(
-            'https://api.spotify.com/v1/me/player/currently-playing',
-            headers=headers,
-            timeout=10
-        )
-        if response.status_code == 200:
-            data = response.json()
-            if data and 'item' in data and data['item']:
-                track = data['item']
-                artists = ', '.join([artist['name'] for artist in track['artists']])
-                track_name = track['name']
-                album_name = track['album']['name']
-                is_playing = data.get('is_playing', False)
-                duration_ms = track.get('duration_ms', 0)
+        # Estado local reciente (con el progreso extrapolado) o una sola consulta a /me/player
+        state = client.player.snapshot()
+        if state is None:
+            response, _ = fetch_player_state()
+            if response.status_code == 200:
+                state = client.player.snapshot(max_age=float('inf'))
+            elif response.status_code == 403:
                 return {
-                    "success": True,
-                    "track": track_name,
-                    "artist": artists,
-                    "album": album_name,
-                    "status": "Reproduciendo" if is_playing else "Pausado",
-                    "duration": f"{duration_ms // 60000}:{(duration_ms % 60000) // 1000:02d}"
+                    "success": False,
+                    "error": "Token expirado o permisos insuficientes. Ejecuta spotify_auth.py de nuevo."
                 }
-            else:
+            elif response.status_code == 404:
                 return {
                     "success": False,
-                    "error": "No hay ninguna canción reproduciéndose actualmente"
+                    "error": "No hay dispositivos activos."
                 }
-        elif response.status_code == 204:
+            elif response.status_code != 204:
+                return {
+                    "success": False,
+                    "error": f"Error obteniendo canción actual: {response.status_code}"
+                }
+
+        if not state or not state.get('item'):
             return {
                 "success": False,
                 "error": "No hay ninguna canción reproduciéndose actualmente"
             }
-        elif response.status_code == 403:
-            return {
-                "success": False,
-                "error": "Token expirado o permisos insuficientes. Ejecuta spotify_auth.py de nuevo."
-            }
-        elif response.status_code == 404:
-            return {
-                "success": False,
-                "error": "No hay dispositivos activos."
-            }
-        else:
-            return {
-                "success": False,
-                "error": f"Error obteniendo canción actual: {response.status_code}"
-            }
+
+        track = state['item']
+        artists = ', '.join([artist['name'] for artist in track['artists']])
+        duration_ms = track.get('duration_ms', 0)
+        result = {
+            "success": True,
+            "track": track['name'],
+            "artist": artists,
+            "album": track['album']['name'],
+            "status": "Reproduciendo" if state['is_playing'] else "Pausado",
+            "duration": format_ms(duration_ms),
+            "progress": format_ms(min(state['progress_ms'], duration_ms) if duration_ms else state['progress_ms'])
+        }
+        device = state.get('device') or {}
+        if device.get('name'):
+            result["device"] = device['name']
+        if state.get('shuffle_state') is not None:
+            result["shuffle"] = state['shuffle_state']
+        if state.get('repeat_state') is not None:
+            result["repeat"] = state['repeat_state']
+        return result
     except Exception as e:
         return {
             "success": False,
@@ -230,49 +348,32 @@ def current_track():
 
 def search_and_play(query):
     """Buscar una canción y reproducirla automáticamente"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Paso 1: Buscar la canción
-        search_params = {
-            'q': query,
-            'type': 'track',
-            'limit': 1,  # Solo necesitamos el primer resultado
-            'market': 'ES'
-        }
+        # Paso 1: Buscar la canción (índice de la biblioteca, búsquedas recordadas o /search)
+        try:
+            track, source = search_track(query)
+        except SpotifyAPIError as e:
+            return {"success": False, "error": f"Error en búsqueda: HTTP {e.status_code}"}
         
-        search_response = requests.get(
-            'https://api.spotify.com/v1/search',
-            headers=headers,
-            params=search_params,
-            timeout=10
-        )
-        
-        if search_response.status_code != 200:
-            return {"success": False, "error": f"Error en búsqueda: HTTP {search_response.status_code}"}
-        
-        search_data = search_response.json()
-        tracks = search_data.get('tracks', {}).get('items', [])
-        
-        if not tracks:
+        if track is None:
             return {"success": False, "error": f"No se encontraron resultados para: '{query}'"}
         
-        # Obtener información de la primera canción encontrada
-        track = tracks[0]
         track_uri = track['uri']
         track_name = track['name']
         artists = ', '.join([artist['name'] for artist in track['artists']])
         album_name = track['album']['name']
         
-        # Paso 2: Obtener dispositivo activo
-        device_id = get_active_device()
-        if not device_id:
+        # Paso 2: Reproducir la canción en el dispositivo activo
+        play_data = {
+            'uris': [track_uri],
+            'position_ms': 0
+        }
+        
+        play_response, device_id = send_player_command('PUT', '/me/player/play', json=play_data)
+        if play_response is None:
             return {
                 "success": False, 
                 "error": "No hay dispositivo activo",
@@ -283,20 +384,8 @@ def search_and_play(query):
                 }
             }
         
-        # Paso 3: Reproducir la canción
-        play_data = {
-            'uris': [track_uri],
-            'position_ms': 0
-        }
-        
-        play_response = requests.put(
-            f'https://api.spotify.com/v1/me/player/play?device_id={device_id}',
-            headers=headers,
-            json=play_data,
-            timeout=10
-        )
-        
         if play_response.status_code == 204:
+            client.player.set_track(track, device_id)
             return {
                 "success": True,
                 "action": "search_and_play",
@@ -306,6 +395,7 @@ def search_and_play(query):
                     "album": album_name,
                     "uri": track_uri
                 },
+                "source": source,
                 "device_id": device_id
             }
         elif play_response.status_code == 403:
@@ -342,147 +432,451 @@ def search_and_play(query):
     except Exception as e:
         return {"success": False, "error": f"Error de conexión: {str(e)}"}
 
-def create_personal_release_radar(weeks_back=4, include_features=True, playlist_name=None):
-    """Crear playlist con lanzamientos recientes de artistas que sigues y te gustan"""
-    if not ACCESS_TOKEN:
-        return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
+def parse_track_uri(item):
+    """URI de Spotify si item ya es un URI o un enlace open.spotify.com de track/episodio, si no None"""
+    match = TRACK_URI_PATTERN.match(item.strip())
+    if not match:
+        return None
+    kind = match.group(1) or match.group(2)
+    return f"spotify:{kind}:{match.group(3)}"
+
+def search_track(query, market=SEARCH_MARKET):
+    """Primera canción para la búsqueda: índice local, búsquedas recordadas o /search
     
+    Devuelve (track, source); track es None si no hay resultados. Lanza SpotifyAPIError si /search falla.
+    """
+    track = library_index.lookup(query)
+    if track is not None:
+        return track, "library"
+
+    found, track = search_cache.get(query, market)
+    if found:
+        return track, "cache"
+
+    search_params = {
+        'q': query,
+        'type': 'track',
+        'limit': 1,  # Solo necesitamos el primer resultado
+        'market': market
+    }
+    response = client.get('/search', params=search_params)
+    if response.status_code != 200:
+        raise SpotifyAPIError(response)
+
+    tracks = response.json().get('tracks', {}).get('items', [])
+    track = compact_track(tracks[0]) if tracks else None
+    search_cache.put(query, market, track)
+    return track, "search"
+
+def resolve_track(item):
+    """Convierte una búsqueda o URI en {"input", "uri", ...}; si no se encuentra incluye "error" """
+    uri = parse_track_uri(item)
+    if uri:
+        return {"input": item, "uri": uri}
+
     try:
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
+        track, source = search_track(item)
+    except SpotifyAPIError as e:
+        return {"input": item, "error": f"Error en búsqueda: HTTP {e.status_code}"}
+    except Exception as e:
+        return {"input": item, "error": f"Error de conexión: {str(e)}"}
+
+    if track is None:
+        return {"input": item, "error": "Sin resultados"}
+    return {
+        "input": item,
+        "uri": track['uri'],
+        "name": track['name'],
+        "artist": ', '.join([artist['name'] for artist in track['artists']]),
+        "album": track['album']['name'],
+        "source": source,
+        "_track": track
+    }
+
+def queue_tracks(items, mode="queue"):
+    """Resolver varias búsquedas/URIs en paralelo y encolarlas o reproducirlas en una sola llamada
+    
+    mode="play" reemplaza la reproducción actual con todas las canciones (un solo PUT /me/player/play);
+    mode="queue" las agrega en orden a la cola del dispositivo activo.
+    """
+    if not token_manager.has_credentials():
+        return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
+
+    try:
+        resolved = list(map_concurrently(resolve_track, items, max_workers=QUEUE_CONCURRENCY))
+        found = [r for r in resolved if 'uri' in r]
+        not_found = [{"input": r["input"], "error": r["error"]} for r in resolved if 'uri' not in r]
+        tracks = [{k: v for k, v in r.items() if not k.startswith('_')} for r in found]
+
+        if not found:
+            return {"success": False, "error": "No se encontró ninguna canción", "not_found": not_found}
+
+        uris = [r['uri'] for r in found]
+        if mode == "play":
+            response, device_id = send_player_command('PUT', '/me/player/play', json={'uris': uris, 'position_ms': 0})
+            if response is None:
+                return {"success": False, "error": "No hay dispositivo activo", "tracks": tracks, "not_found": not_found}
+            if response.status_code not in (200, 204):
+                return {"success": False, "error": f"Error reproduciendo: HTTP {response.status_code}",
+                        "tracks": tracks, "not_found": not_found}
+            if '_track' in found[0]:
+                client.player.set_track(found[0]['_track'], device_id)
+            return {
+                "success": True,
+                "action": "play_tracks",
+                "played": len(uris),
+                "tracks": tracks,
+                "not_found": not_found,
+                "device_id": device_id
+            }
+
+        # /me/player/queue acepta un URI por request: se envían en orden, uno tras otro
+        queued = 0
+        device_id = None
+        error = None
+        for uri in uris:
+            response, device_id = send_player_command('POST', '/me/player/queue', params={'uri': uri})
+            if response is None:
+                error = "No hay dispositivo activo"
+                break
+            if response.status_code not in (200, 204):
+                error = f"Error agregando a la cola: HTTP {response.status_code}"
+                break
+            queued += 1
+
+        result = {
+            "success": error is None,
+            "action": "queue_tracks",
+            "queued": queued,
+            "tracks": tracks,
+            "not_found": not_found,
+            "device_id": device_id
         }
+        if error:
+            result["error"] = error
+        return result
+    except Exception as e:
+        return {"success": False, "error": f"Error de conexión: {str(e)}"}
+
+def iter_pages_safely(pages):
+    """Itera un recorrido paginado; si Spotify responde con error se conservan las páginas ya leídas"""
+    try:
+        yield from pages
+    except SpotifyAPIError:
+        return
+
+class OperationCancelled(Exception):
+    """El cliente MCP canceló la herramienta en curso"""
+
+def load_radar_state():
+    """Leer el estado guardado del Release Radar incremental"""
+    try:
+        with open(RADAR_STATE_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('users', {})
+    return state
+
+def update_radar_state(user_id, update):
+    """Aplicar update(estado_del_usuario) y guardar el archivo de forma atómica"""
+    with radar_state_lock:
+        state = load_radar_state()
+        update(state['users'].setdefault(user_id, {}))
+        tmp_path = f"{RADAR_STATE_PATH}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, RADAR_STATE_PATH)
+
+def map_concurrently(func, items, max_workers=None, cancel_event=None, failures=None):
+    """Aplica func a cada elemento con concurrencia acotada y entrega los resultados en orden
+    
+    Es un generador: cada resultado se entrega apenas está listo (y los anteriores también).
+    Los elementos que fallan se omiten y, si se pasa la lista failures, se agregan a ella como
+    (elemento, excepción). Si se activa cancel_event, o el llamador deja de iterar, las tareas
+    pendientes se descartan; con cancel_event se lanza OperationCancelled.
+    """
+    pool = ThreadPoolExecutor(max_workers=max_workers or RADAR_CONCURRENCY, thread_name_prefix='spotify-radar')
+    try:
+        futures = [(item, pool.submit(contextvars.copy_context().run, func, item)) for item in items]
+        for item, future in futures:
+            if cancel_event is not None and cancel_event.is_set():
+                raise OperationCancelled()
+            try:
+                result = future.result()
+            except Exception as e:
+                # Continuar con el siguiente elemento; el llamador decide cómo informar el fallo
+                if failures is not None:
+                    failures.append((item, e))
+                continue
+            yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def parse_release_date(release_date_str):
+    """Convierte una fecha de lanzamiento de Spotify (año, año-mes o fecha completa) en datetime"""
+    if len(release_date_str) == 4:  # Solo año
+        return datetime.strptime(f"{release_date_str}-01-01", '%Y-%m-%d')
+    elif len(release_date_str) == 7:  # Año-mes
+        return datetime.strptime(f"{release_date_str}-01", '%Y-%m-%d')
+    else:  # Fecha completa
+        return datetime.strptime(release_date_str, '%Y-%m-%d')
+
+def fetch_artist_recent_albums(artist, cutoff_date, known_album_ids=()):
+    """Obtener los álbumes/singles del artista publicados desde cutoff_date
+    
+    Los grupos se piden juntos: Spotify los devuelve uno tras otro (primero album, luego single),
+    cada uno del más reciente al más antiguo. Cuando el grupo que se está recorriendo llega a un
+    lanzamiento viejo y la página termina sin que empiece el siguiente, los grupos que faltan se
+    piden aparte en lugar de paginar por todo el catálogo viejo.
+    known_album_ids son álbumes ya incluidos en una ejecución anterior del radar.
+    """
+    recent_albums = []
+    pending_groups = list(ARTIST_ALBUM_GROUPS)
+    
+    while pending_groups:
+        pages = client.paginate(
+            f'/artists/{artist["id"]}/albums',
+            params={'include_groups': ','.join(pending_groups), 'limit': PAGE_SIZE, 'market': 'US'},
+            prefetch=False
+        )
         
-        from datetime import datetime, timedelta
-        import time
+        for page in pages:
+            for album in page:
+                group = album.get('album_group') or album.get('album_type')
+                if group not in pending_groups:
+                    continue
+                # Empezó otro grupo: los anteriores ya se recorrieron completos
+                del pending_groups[:pending_groups.index(group)]
+                
+                # Verificar fecha de lanzamiento
+                release_date_str = album.get('release_date', '')
+                if not release_date_str:
+                    continue
+                
+                try:
+                    release_date = parse_release_date(release_date_str)
+                except ValueError:
+                    # Si no se puede parsear la fecha, saltar
+                    continue
+                
+                # Lo que sigue en este grupo es aún más viejo: el grupo está terminado
+                if release_date < cutoff_date:
+                    pending_groups.remove(group)
+                    continue
+                
+                if album['id'] in known_album_ids:
+                    continue
+                
+                album['_artist_name'] = artist['name']
+                album['_artist_id'] = artist['id']
+                recent_albums.append(album)
+            
+            # El grupo en curso terminó y hay más páginas (todas de ese grupo, o vacías de interés)
+            if group not in pending_groups and len(page) == PAGE_SIZE:
+                pages.close()
+                break
+        else:
+            # Se recorrieron todas las páginas
+            break
+    
+    return recent_albums
+
+def fetch_albums_batch(album_ids):
+    """Obtener hasta 20 álbumes con sus tracks en una sola request"""
+    albums_response = client.get('/albums', params={'ids': ','.join(album_ids), 'market': 'US'})
+    
+    if albums_response.status_code != 200:
+        raise SpotifyAPIError(albums_response)
+    
+    return [album for album in albums_response.json().get('albums', []) if album]
+
+def search_artist_tracks(artist_name):
+    """Tracks de la búsqueda artist:"nombre" (recordada en feature_search_cache); [] si /search falla"""
+    query = f'artist:"{artist_name}"'
+    found, tracks = feature_search_cache.get(query, 'US')
+    if found:
+        return tracks
+    
+    response = client.get('/search', params={'q': query, 'type': 'track', 'limit': 8, 'market': 'US'})
+    if response.status_code != 200:
+        return []
+    
+    # Solo los campos que usa el radar: la entrada ocupa poco en memoria y en disco
+    tracks = [
+        {
+            "id": track.get('id'),
+            "uri": track.get('uri'),
+            "name": track.get('name', ''),
+            "artists": [{"name": a.get('name', '')} for a in track.get('artists') or []],
+            "album": {"name": (track.get('album') or {}).get('name', ''),
+                      "release_date": (track.get('album') or {}).get('release_date', '')}
+        }
+        for track in response.json().get('tracks', {}).get('items', []) if track
+    ]
+    feature_search_cache.put(query, 'US', tracks)
+    return tracks
+
+def fetch_artist_features(artist, cutoff_date):
+    """Buscar colaboraciones publicadas desde cutoff_date donde el artista aparece como invitado"""
+    features = []
+    
+    for track in search_artist_tracks(artist['name']):
+        # Verificar que no sea del artista principal (que sea feature)
+        if not track['artists'] or artist['name'].lower() == track['artists'][0]['name'].lower():
+            continue
+        
+        # Solo colaboraciones publicadas desde cutoff_date
+        release_date_str = track['album']['release_date']
+        try:
+            if not release_date_str or parse_release_date(release_date_str) < cutoff_date:
+                continue
+        except ValueError:
+            continue
         
+        features.append(dict(track, _is_feature=True, _artist_name=artist['name'], _release_date=release_date_str))
+        if len(features) >= 3:  # Max 3 por artista
+            break
+    
+    return features
+
+def create_personal_release_radar(weeks_back=4, include_features=True, playlist_name=None, max_artists=None,
+                                  max_tracks=30, incremental=False, playlist_mode="append",
+                                  progress=None, cancel_event=None):
+    """Crear playlist con lanzamientos recientes de artistas que sigues y te gustan
+    
+    Recorre todos los artistas seguidos y top artistas (o los primeros max_artists)
+    y agrega como máximo max_tracks canciones (None = todas las encontradas).
+    Con incremental=True solo busca lanzamientos posteriores a la última ejecución y
+    actualiza la playlist del radar anterior: playlist_mode "append" agrega al final,
+    "replace" reemplaza su contenido.
+    progress(paso, total, mensaje) recibe el avance; cancel_event detiene el trabajo pendiente.
+    """
+    if not token_manager.has_credentials():
+        return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
+    
+    progress_steps = itertools.count(1)
+    
+    def checkpoint(message, cancellable=True):
+        """Detiene el radar si fue cancelado y notifica el avance"""
+        if cancellable and cancel_event is not None and cancel_event.is_set():
+            raise OperationCancelled()
+        if progress:
+            progress(next(progress_steps), None, message)
+    
+    try:
         current_date = datetime.now()
         cutoff_date = current_date - timedelta(weeks=weeks_back)
         recent_tracks = []
         artists_processed = set()
         
-        # Paso 1: Obtener artistas que sigues
-        following_response = requests.get(
-            'https://api.spotify.com/v1/me/following?type=artist&limit=30',
-            headers=headers,
-            timeout=10
-        )
-        
-        followed_artists = []
-        if following_response.status_code == 200:
-            followed_artists = following_response.json().get('artists', {}).get('items', [])
+        # Obtener información del usuario (el estado incremental se guarda por usuario)
+        user_response = client.get('/me')
+        if user_response.status_code != 200:
+            return {"success": False, "error": "No se pudo obtener información del usuario"}
         
-        # Paso 2: Obtener tus top artistas
-        top_artists_response = requests.get(
-            'https://api.spotify.com/v1/me/top/artists?limit=20&time_range=medium_term',
-            headers=headers,
-            timeout=10
+        user_id = user_response.json()['id']
+        user_state = load_radar_state()['users'].get(user_id, {}) if incremental else {}
+        artists_state = user_state.get('artists', {})
+        recheck_before = (current_date - timedelta(hours=RADAR_RECHECK_HOURS)).isoformat()
+        
+        def fetch_new_albums(artist):
+            """Lanzamientos del artista desde el corte o desde lo último visto en modo incremental"""
+            artist_state = artists_state.get(artist['id'])
+            if not artist_state:
+                return fetch_artist_recent_albums(artist, cutoff_date)
+            since_date = max(cutoff_date, parse_release_date(artist_state['newest_release_date']))
+            return fetch_artist_recent_albums(artist, since_date, set(artist_state.get('album_ids', [])))
+        
+        def fetch_new_features(artist):
+            """Colaboraciones desde el corte o, en modo incremental, desde el día de la revisión anterior"""
+            checked_at = artists_state.get(artist['id'], {}).get('checked_at')
+            if not checked_at:
+                return fetch_artist_features(artist, cutoff_date)
+            return fetch_artist_features(artist, max(cutoff_date, parse_release_date(checked_at[:10])))
+        
+        # Paso 1 y 2: Recorrer todos los artistas que sigues y tus top artistas página por página
+        # (la siguiente página se descarga mientras se procesa la actual)
+        artist_pages = itertools.chain(
+            iter_pages_safely(client.paginate(
+                '/me/following', params={'type': 'artist', 'limit': PAGE_SIZE}, container='artists'
+            )),
+            iter_pages_safely(client.paginate(
+                '/me/top/artists', params={'limit': PAGE_SIZE, 'time_range': 'medium_term'}
+            ))
         )
         
-        top_artists = []
-        if top_artists_response.status_code == 200:
-            top_artists = top_artists_response.json().get('items', [])
-        
-        # Combinar artistas (evitar duplicados)
-        all_artists = []
-        for artist in followed_artists + top_artists:
-            if artist['id'] not in artists_processed:
-                all_artists.append(artist)
-                artists_processed.add(artist['id'])
-        
-        # Paso 3: Buscar lanzamientos recientes de cada artista
-        for i, artist in enumerate(all_artists[:25]):  # Limitar a 25 artistas para no saturar
-            try:
-                # Obtener álbumes recientes del artista
-                albums_response = requests.get(
-                    f'https://api.spotify.com/v1/artists/{artist["id"]}/albums?limit=10&album_type=album,single&market=US',
-                    headers=headers,
-                    timeout=10
-                )
-                
-                if albums_response.status_code == 200:
-                    albums = albums_response.json().get('items', [])
-                    
-                    for album in albums:
-                        # Verificar fecha de lanzamiento
-                        release_date_str = album.get('release_date', '')
-                        if not release_date_str:
-                            continue
-                        
-                        try:
-                            # Manejar diferentes formatos de fecha
-                            if len(release_date_str) == 4:  # Solo año
-                                release_date = datetime.strptime(f"{release_date_str}-01-01", '%Y-%m-%d')
-                            elif len(release_date_str) == 7:  # Año-mes
-                                release_date = datetime.strptime(f"{release_date_str}-01", '%Y-%m-%d')
-                            else:  # Fecha completa
-                                release_date = datetime.strptime(release_date_str, '%Y-%m-%d')
-                            
-                            # Verificar si es reciente
-                            if release_date >= cutoff_date:
-                                # Obtener tracks del álbum/single
-                                album_tracks_response = requests.get(
-                                    f'https://api.spotify.com/v1/albums/{album["id"]}/tracks?limit=5',
-                                    headers=headers,
-                                    timeout=10
-                                )
-                                
-                                if album_tracks_response.status_code == 200:
-                                    album_tracks = album_tracks_response.json().get('items', [])
-                                    
-                                    for track in album_tracks[:3]:  # Max 3 tracks por álbum
-                                        track['_release_date'] = release_date_str
-                                        track['_album_name'] = album['name']
-                                        track['_artist_name'] = artist['name']
-                                        recent_tracks.append(track)
-                        
-                        except ValueError:
-                            # Si no se puede parsear la fecha, saltar
-                            continue
+        # Paso 3: Buscar lanzamientos recientes de cada artista (en paralelo, concurrencia acotada)
+        feature_artists = []
+        recent_albums = {}
+        checked_artists = []
+        failed_artists = []
+        for page in artist_pages:
+            # Combinar artistas (evitar duplicados)
+            new_artists = []
+            for artist in page:
+                if max_artists is not None and len(artists_processed) >= max_artists:
+                    break
+                if artist['id'] not in artists_processed:
+                    new_artists.append(artist)
+                    artists_processed.add(artist['id'])
+            
+            # En modo incremental no se vuelve a consultar a quien se revisó hace poco
+            new_artists = [
+                artist for artist in new_artists
+                if artists_state.get(artist['id'], {}).get('checked_at', '') < recheck_before
+            ]
+            # Los primeros 10 artistas se usan luego para buscar features
+            feature_artists.extend(new_artists[:10 - len(feature_artists)])
+            
+            # Avance por artista (los omitidos por revisión reciente cuentan como revisados)
+            artists_done = len(artists_processed) - len(new_artists)
+            if not new_artists:
+                checkpoint(f"Artistas revisados: {artists_done}, lanzamientos recientes: {len(recent_albums)}")
+            for artist_albums in map_concurrently(
+                fetch_new_albums, new_artists, cancel_event=cancel_event, failures=failed_artists
+            ):
+                for album in artist_albums:
+                    recent_albums.setdefault(album['id'], album)
+                artists_done += 1
+                checkpoint(f"Artistas revisados: {artists_done}, lanzamientos recientes: {len(recent_albums)}")
+            
+            # Un artista cuya consulta falló no cuenta como revisado: se reintenta en la próxima ejecución
+            failed_ids = {artist['id'] for artist, _ in failed_artists}
+            checked_artists.extend(artist['id'] for artist in new_artists if artist['id'] not in failed_ids)
+            
+            if max_artists is not None and len(artists_processed) >= max_artists:
+                break
+        
+        # Resolver los tracks de todos los álbumes en lotes de 20 con /albums?ids=
+        album_ids = list(recent_albums)
+        album_batches = [album_ids[i:i + ALBUMS_BATCH_SIZE] for i in range(0, len(album_ids), ALBUMS_BATCH_SIZE)]
+        failed_batches = []
+        album_track_ids = {}
+        for batch_number, albums in enumerate(
+            map_concurrently(fetch_albums_batch, album_batches, cancel_event=cancel_event, failures=failed_batches), 1
+        ):
+            checkpoint(f"Lotes de álbumes resueltos: {batch_number}/{len(album_batches)}")
+            for album in albums:
+                source_album = recent_albums.get(album['id'], album)
+                album_tracks = album.get('tracks', {}).get('items', [])
+                album_track_ids[album['id']] = [track.get('id') for track in album_tracks[:3]]
                 
-                # Pausa pequeña para no saturar la API
-                if i % 5 == 0:
-                    time.sleep(0.1)
-                    
-            except Exception as e:
-                # Continuar con el siguiente artista si hay error
-                continue
+                for track in album_tracks[:3]:  # Max 3 tracks por álbum
+                    track['_release_date'] = source_album.get('release_date', '')
+                    track['_album_name'] = source_album['name']
+                    track['_artist_name'] = source_album.get('_artist_name', 'Unknown')
+                    recent_tracks.append(track)
         
         # Paso 4: Si include_features, buscar colaboraciones recientes
         if include_features and len(recent_tracks) < 20:  # Solo si necesitamos más tracks
-            for artist in all_artists[:10]:  # Limitar búsqueda de features
-                try:
-                    features_response = requests.get(
-                        f'https://api.spotify.com/v1/search?q=artist:"{artist["name"]}"&type=track&limit=8&market=US',
-                        headers=headers,
-                        timeout=10
-                    )
-                    
-                    if features_response.status_code == 200:
-                        feature_tracks = features_response.json().get('tracks', {}).get('items', [])
-                        
-                        for track in feature_tracks[:3]:  # Max 3 por artista
-                            # Verificar que no sea del artista principal (que sea feature)
-                            main_artist = track['artists'][0]['name'].lower()
-                            if artist['name'].lower() != main_artist:
-                                track['_is_feature'] = True
-                                track['_artist_name'] = artist['name']
-                                recent_tracks.append(track)
-                        
-                        time.sleep(0.1)
-                        
-                except Exception:
-                    continue
+            for feature_tracks in map_concurrently(fetch_new_features, feature_artists, cancel_event=cancel_event):
+                recent_tracks.extend(feature_tracks)
+            checkpoint(f"Colaboraciones revisadas de {len(feature_artists)} artistas")
         
-        if not recent_tracks:
-            return {
-                "success": False, 
-                "error": f"No se encontraron lanzamientos recientes en las últimas {weeks_back} semanas"
-            }
-        
-        # Paso 5: Eliminar duplicados y ordenar por fecha
+        # Paso 5: Eliminar duplicados (también los ya agregados en ejecuciones anteriores) y ordenar por fecha
         unique_tracks = []
-        seen_ids = set()
+        seen_ids = set(user_state.get('track_ids', []))
         
         for track in recent_tracks:
             if track and track.get('id') and track['id'] not in seen_ids:
@@ -492,53 +886,106 @@ def create_personal_release_radar(weeks_back=4, include_features=True, playlist_
         # Ordenar por fecha de lanzamiento (más recientes primero)
         unique_tracks.sort(key=lambda x: x.get('_release_date', ''), reverse=True)
         
-        # Limitar a máximo 30 tracks
-        unique_tracks = unique_tracks[:30]
-        
-        # Paso 6: Crear playlist
-        if not playlist_name:
-            playlist_name = f"Personal Release Radar - {current_date.strftime('%b %Y')}"
+        # Limitar a máximo max_tracks tracks
+        unique_tracks = unique_tracks[:max_tracks]
         
-        # Obtener información del usuario
-        user_response = requests.get('https://api.spotify.com/v1/me', headers=headers, timeout=10)
-        if user_response.status_code != 200:
-            return {"success": False, "error": "No se pudo obtener información del usuario"}
-        
-        user_id = user_response.json()['id']
-        
-        # Crear playlist
-        playlist_data = {
-            "name": playlist_name,
-            "description": f"Fresh releases from your followed and top artists (last {weeks_back} weeks)",
-            "public": False
-        }
+        # Paso 6: Reutilizar la playlist del radar anterior (modo incremental) o crear una nueva
+        playlist = None
+        if incremental and user_state.get('playlist_id'):
+            existing_response = client.get(
+                f"/playlists/{user_state['playlist_id']}", params={'fields': 'id,name,external_urls'}
+            )
+            if existing_response.status_code == 200:
+                playlist = existing_response.json()
+                playlist_name = playlist['name']
         
-        playlist_response = requests.post(
-            f'https://api.spotify.com/v1/users/{user_id}/playlists',
-            headers=headers,
-            json=playlist_data,
-            timeout=10
-        )
+        if not unique_tracks and playlist is None:
+            return {
+                "success": False, 
+                "error": f"No se encontraron lanzamientos recientes en las últimas {weeks_back} semanas"
+            }
         
-        if playlist_response.status_code != 201:
-            return {"success": False, "error": f"Error creando playlist: HTTP {playlist_response.status_code}"}
+        if playlist is None:
+            checkpoint(f"Creando playlist con {len(unique_tracks)} tracks")
+            if not playlist_name:
+                playlist_name = f"Personal Release Radar - {current_date.strftime('%b %Y')}"
+            
+            # Crear playlist
+            playlist_data = {
+                "name": playlist_name,
+                "description": f"Fresh releases from your followed and top artists (last {weeks_back} weeks)",
+                "public": False
+            }
+            
+            playlist_response = client.post(
+                f'/users/{user_id}/playlists',
+                json=playlist_data
+            )
+            
+            if playlist_response.status_code != 201:
+                return {"success": False, "error": f"Error creando playlist: HTTP {playlist_response.status_code}"}
+            
+            playlist = playlist_response.json()
+            reused_playlist = False
+        else:
+            checkpoint(f"Actualizando playlist existente con {len(unique_tracks)} tracks nuevos")
+            reused_playlist = True
         
-        playlist = playlist_response.json()
         playlist_id = playlist['id']
         
-        # Paso 7: Agregar tracks a la playlist
+        # Paso 7: Agregar tracks a la playlist (en bloques de 100, en orden). Con la playlist ya creada
+        # una cancelación no corta la escritura: quedaría a medias y fuera del estado incremental
         track_uris = [track['uri'] for track in unique_tracks if track.get('uri')]
         
         if track_uris:
-            add_tracks_response = requests.post(
-                f'https://api.spotify.com/v1/playlists/{playlist_id}/tracks',
-                headers=headers,
-                json={"uris": track_uris},
-                timeout=10
-            )
+            write_result = PlaylistWriter(
+                client, playlist_id,
+                progress=lambda written, total: checkpoint(f"Tracks agregados: {written}/{total}", cancellable=False)
+            ).write(track_uris, replace=reused_playlist and playlist_mode == "replace")
             
-            if add_tracks_response.status_code != 201:
-                return {"success": False, "error": f"Error agregando tracks: HTTP {add_tracks_response.status_code}"}
+            if not write_result['success']:
+                return {
+                    "success": False,
+                    "error": f"Error agregando tracks: {write_result['error']}",
+                    "playlist": {"name": playlist_name, "id": playlist_id, "url": playlist['external_urls']['spotify']},
+                    "tracks_added": write_result['written'],
+                    "tracks_total": write_result['total']
+                }
+        
+        # Guardar lo visto para que la próxima ejecución incremental solo busque lo nuevo
+        def remember_run(state):
+            artists = state.setdefault('artists', {})
+            # Un álbum cuenta como visto solo si sus tracks llegaron a la playlist (en esta ejecución
+            # o en una anterior); los que cortó max_tracks o cuyo lote falló se buscan otra vez
+            included_ids = set(state.get('track_ids', [])) | {t['id'] for t in unique_tracks}
+            albums_by_artist = {}
+            for album in recent_albums.values():
+                albums_by_artist.setdefault(album.get('_artist_id'), []).append(album)
+            
+            checked_at = current_date.isoformat()
+            for artist_id in checked_artists:
+                artist_state = artists.setdefault(artist_id, {'newest_release_date': cutoff_date.strftime('%Y-%m-%d')})
+                albums = albums_by_artist.get(artist_id, [])
+                done = [a for a in albums if included_ids.issuperset(album_track_ids.get(a['id'], [None]))]
+                pending = [a for a in albums if a not in done]
+                if done:
+                    artist_state['album_ids'] = (
+                        artist_state.get('album_ids', []) + [a['id'] for a in done]
+                    )[-RADAR_REMEMBERED_ALBUMS:]
+                if pending:
+                    # No avanzar más allá del pendiente más viejo; el artista se revisa de nuevo
+                    # sin esperar a SPOTIFY_RADAR_RECHECK_HOURS
+                    bound = min(pending, key=lambda a: parse_release_date(a['release_date']))
+                else:
+                    artist_state['checked_at'] = checked_at
+                    bound = max(done, key=lambda a: parse_release_date(a['release_date'])) if done else None
+                if bound and parse_release_date(bound['release_date']) > parse_release_date(artist_state['newest_release_date']):
+                    artist_state['newest_release_date'] = bound['release_date']
+            state['playlist_id'] = playlist_id
+            state['track_ids'] = (state.get('track_ids', []) + [t['id'] for t in unique_tracks])[-RADAR_REMEMBERED_TRACKS:]
+            state['last_run'] = current_date.isoformat()
+        
+        update_radar_state(user_id, remember_run)
         
         # Contar estadísticas
         artists_count = len(set(track.get('_artist_name', 'Unknown') for track in unique_tracks))
@@ -559,65 +1006,70 @@ def create_personal_release_radar(weeks_back=4, include_features=True, playlist_
             "stats": {
                 "total_tracks_found": len(unique_tracks),
                 "from_followed_artists": len([t for t in unique_tracks if not t.get('_is_feature')]),
-                "features": features_count if include_features else 0
+                "features": features_count if include_features else 0,
+                "incremental": incremental,
+                "reused_playlist": reused_playlist,
+                "playlist_mode": playlist_mode if reused_playlist else "create",
+                "artists_checked": len(checked_artists),
+                "artists_skipped": len(artists_processed) - len(checked_artists),
+                # Artistas y álbumes que Spotify no devolvió (se vuelven a intentar en la próxima ejecución)
+                "artists_failed": len(failed_artists),
+                "albums_failed": sum(len(batch) for batch, _ in failed_batches)
             }
         }
         
+    except OperationCancelled:
+        return {"success": False, "error": "Release Radar Personal cancelado"}
     except Exception as e:
         return {"success": False, "error": f"Error creando Release Radar Personal: {str(e)}"}
 
 def play_top_track(time_range="medium_term", limit=20):
     """Reproducir una canción aleatoria de tus top tracks"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        import random
-        
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Paso 1: Obtener top tracks
+        # Paso 1 y 2: Recorrer los top tracks página por página y elegir uno al azar
+        # (muestreo de reservorio: no hace falta tener toda la lista en memoria)
         params = {
             'time_range': time_range,
-            'limit': limit,
+            'limit': min(limit, PAGE_SIZE),
             'offset': 0
         }
         
-        top_tracks_response = requests.get(
-            'https://api.spotify.com/v1/me/top/tracks',
-            headers=headers,
-            params=params,
-            timeout=10
-        )
-        
-        if top_tracks_response.status_code != 200:
+        total_tracks = 0
+        random_track = None
+        try:
+            for page in client.paginate('/me/top/tracks', params=params, max_items=limit):
+                for track in page:
+                    total_tracks += 1
+                    if random.randrange(total_tracks) == 0:
+                        random_track = track
+        except SpotifyAPIError as e:
             return {
                 "success": False, 
-                "error": f"Error obteniendo top tracks: HTTP {top_tracks_response.status_code}"
+                "error": f"Error obteniendo top tracks: HTTP {e.status_code}"
             }
         
-        top_tracks_data = top_tracks_response.json()
-        tracks = top_tracks_data.get('items', [])
-        
-        if not tracks:
+        if not random_track:
             return {
                 "success": False, 
                 "error": f"No se encontraron top tracks para el período {time_range}"
             }
         
-        # Paso 2: Seleccionar track aleatorio
-        random_track = random.choice(tracks)
         track_uri = random_track['uri']
         track_name = random_track['name']
         artists = ', '.join([artist['name'] for artist in random_track['artists']])
         album_name = random_track['album']['name']
         
-        # Paso 3: Verificar dispositivo activo
-        device_id = get_active_device()
-        if not device_id:
+        # Paso 3: Reproducir la canción en el dispositivo activo
+        play_data = {
+            'uris': [track_uri],
+            'position_ms': 0
+        }
+        
+        play_response, device_id = send_player_command('PUT', '/me/player/play', json=play_data)
+        if play_response is None:
             return {
                 "success": False,
                 "error": "No hay dispositivo activo",
@@ -629,20 +1081,8 @@ def play_top_track(time_range="medium_term", limit=20):
                 }
             }
         
-        # Paso 4: Reproducir la canción
-        play_data = {
-            'uris': [track_uri],
-            'position_ms': 0
-        }
-        
-        play_response = requests.put(
-            f'https://api.spotify.com/v1/me/player/play?device_id={device_id}',
-            headers=headers,
-            json=play_data,
-            timeout=10
-        )
-        
         if play_response.status_code == 204:
+            client.player.set_track(random_track, device_id)
             return {
                 "success": True,
                 "action": "play_top_track",
@@ -653,9 +1093,9 @@ def play_top_track(time_range="medium_term", limit=20):
                     "uri": track_uri
                 },
                 "stats": {
-                    "total_top_tracks": len(tracks),
+                    "total_top_tracks": total_tracks,
                     "time_range": time_range,
-                    "selected_from": f"top {len(tracks)} tracks"
+                    "selected_from": f"top {total_tracks} tracks"
                 },
                 "device_id": device_id
             }
@@ -695,70 +1135,56 @@ def play_top_track(time_range="medium_term", limit=20):
 
 def get_top_tracks(time_range="medium_term", limit=20):
     """Obtener lista de tus top tracks sin reproducir"""
-    if not ACCESS_TOKEN:
+    if not token_manager.has_credentials():
         return {"success": False, "error": "ACCESS_TOKEN no configurado en .env"}
     
     try:
-        headers = {
-            'Authorization': f'Bearer {ACCESS_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Parámetros para la API
+        # Parámetros para la API (Spotify entrega como máximo 50 por página)
         params = {
             'time_range': time_range,
-            'limit': limit,
+            'limit': min(limit, PAGE_SIZE),
             'offset': 0
         }
         
-        response = requests.get(
-            'https://api.spotify.com/v1/me/top/tracks',
-            headers=headers,
-            params=params,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            tracks = data.get('items', [])
-            
-            if not tracks:
-                return {
-                    "success": False, 
-                    "error": f"No se encontraron top tracks para el período {time_range}"
-                }
-            
-            # Formatear la respuesta con información de los tracks
-            formatted_tracks = []
-            for i, track in enumerate(tracks, 1):
+        # Formatear la respuesta página por página mientras se descarga la siguiente
+        formatted_tracks = []
+        for page in client.paginate('/me/top/tracks', params=params, max_items=limit):
+            for track in page:
                 artists = ', '.join([artist['name'] for artist in track['artists']])
                 formatted_tracks.append({
-                    "position": i,
+                    "position": len(formatted_tracks) + 1,
                     "name": track['name'],
                     "artist": artists,
                     "album": track['album']['name'],
                     "popularity": track.get('popularity', 0),
                     "uri": track['uri']
                 })
-            
+        
+        if not formatted_tracks:
             return {
-                "success": True,
-                "time_range": time_range,
-                "total_tracks": len(formatted_tracks),
-                "tracks": formatted_tracks
+                "success": False, 
+                "error": f"No se encontraron top tracks para el período {time_range}"
             }
-            
-        elif response.status_code == 403:
+        
+        return {
+            "success": True,
+            "time_range": time_range,
+            "total_tracks": len(formatted_tracks),
+            "tracks": formatted_tracks
+        }
+        
+    except SpotifyAPIError as e:
+        if e.status_code == 403:
             return {
                 "success": False,
                 "error": "Token expirado o no tiene permisos para 'user-top-read'. Ejecuta spotify_auth.py de nuevo con todos los scopes."
             }
-        elif response.status_code == 401:
+        elif e.status_code == 401:
             return {
                 "success": False,
                 "error": "Token inválido. Ejecuta spotify_auth.py de nuevo."
             }
-        elif response.status_code == 429:
+        elif e.status_code == 429:
             return {
                 "success": False,
                 "error": "Demasiadas requests. Espera un momento e intenta de nuevo."
@@ -766,205 +1192,349 @@ def get_top_tracks(time_range="medium_term", limit=20):
         else:
             return {
                 "success": False,
-                "error": f"Error obteniendo top tracks: HTTP {response.status_code}"
+                "error": f"Error obteniendo top tracks: HTTP {e.status_code}"
             }
             
     except Exception as e:
         return {"success": False, "error": f"Error de conexión: {str(e)}"}
 
+def server_stats(reset=False):
+    """Métricas de la instrumentación: latencia por herramienta, requests por endpoint, reintentos y caché"""
+    if not metrics.enabled:
+        return {
+            "success": False,
+            "error": "La instrumentación está desactivada (SPOTIFY_METRICS=false)",
+            "response_cache": client.cache.stats()
+        }
+
+    stats = metrics.snapshot()
+    stats["response_cache"] = client.cache.stats()
+    stats["library_index"] = library_index.stats()
+    stats["search_cache"] = search_cache.stats()
+    stats["feature_search_cache"] = feature_search_cache.stats()
+    if accounts.multiple:
+        # Las cachés anteriores son de la cuenta en curso; el catálogo es común a todas
+        stats["account"] = accounts.current().name
+        stats["catalog_cache"] = accounts.catalog_cache.stats()
+    if reset:
+        metrics.reset()
+    return dict({"success": True}, **stats)
+
 # MCP Server Implementation
 server = Server("spotify-mcp")
 
+# Registro de herramientas: cada una declara su esquema y handler una sola vez; los validadores
+# se compilan al registrar y la lista de list_tools se construye una única vez
+TIME_RANGE_PROPERTY = {
+    "type": "string",
+    "description": "Time period for top tracks",
+    "enum": ["short_term", "medium_term", "long_term"],
+    "default": "medium_term"
+}
+
+# Con varias cuentas todas las herramientas aceptan además "account"
+tools = ToolRegistry(common_properties=dict(OUTPUT_PROPERTIES, **(account_property(accounts) if accounts.multiple else {})))
+
+tools.add(
+    "next_track",
+    "Skip to next track on active Spotify device",
+    next_track
+)
+tools.add(
+    "previous_track",
+    "Go to previous track on active Spotify device",
+    previous_track
+)
+tools.add(
+    "pause_track",
+    "Pause playback on active Spotify device",
+    pause_track
+)
+tools.add(
+    "resume_track",
+    "Resume/play playback on active Spotify device",
+    resume_track
+)
+tools.add(
+    "current_track",
+    "Get information about the currently playing track on Spotify",
+    current_track
+)
+tools.add(
+    "search_and_play",
+    "Search for a song on Spotify and play it immediately",
+    search_and_play,
+    properties={
+        "query": {
+            "type": "string",
+            "description": "Search query for the song (artist, song name, album, etc.)",
+            "minLength": 1
+        }
+    },
+    required=["query"]
+)
+tools.add(
+    "get_top_tracks",
+    "Get your top tracks from Spotify without playing them",
+    get_top_tracks,
+    properties={
+        "time_range": TIME_RANGE_PROPERTY,
+        "limit": {
+            "type": "integer",
+            "description": f"Number of top tracks to get (1-{TOP_TRACKS_MAX}, fetched in pages of {PAGE_SIZE})",
+            "minimum": 1,
+            "maximum": TOP_TRACKS_MAX,
+            "default": 20
+        }
+    }
+)
+tools.add(
+    "play_top_track",
+    "Play a random song from your top tracks on Spotify",
+    play_top_track,
+    properties={
+        "time_range": TIME_RANGE_PROPERTY,
+        "limit": {
+            "type": "integer",
+            "description": f"Number of top tracks to choose from (1-{TOP_TRACKS_MAX}, fetched in pages of {PAGE_SIZE})",
+            "minimum": 1,
+            "maximum": TOP_TRACKS_MAX,
+            "default": 20
+        }
+    }
+)
+tools.add(
+    "queue_tracks",
+    "Resolve several songs at once (search queries or Spotify track URIs/links) and add them all to the queue, or start playing them as a list, in a single call",
+    queue_tracks,
+    properties={
+        "items": {
+            "type": "array",
+            "description": f"Search queries (artist, song name...) or Spotify track URIs/links, in playback order (1-{QUEUE_MAX_TRACKS})",
+            "items": {"type": "string", "minLength": 1},
+            "minItems": 1,
+            "maxItems": QUEUE_MAX_TRACKS
+        },
+        "mode": {
+            "type": "string",
+            "description": "queue: append to the current queue; play: replace playback with these tracks, starting with the first",
+            "enum": ["queue", "play"],
+            "default": "queue"
+        }
+    },
+    required=["items"]
+)
+tools.add(
+    "create_personal_release_radar",
+    "Create a private playlist with recent releases from the artists you follow and your top artists. Sends progress notifications while it crawls and can be cancelled.",
+    create_personal_release_radar,
+    properties={
+        "weeks_back": {
+            "type": "integer",
+            "description": "How many weeks back to look for new releases (1-52)",
+            "minimum": 1,
+            "maximum": 52,
+            "default": 4
+        },
+        "include_features": {
+            "type": "boolean",
+            "description": "Also look for recent collaborations where your artists are featured",
+            "default": True
+        },
+        "playlist_name": {
+            "type": "string",
+            "description": "Name of the new playlist (defaults to 'Personal Release Radar - <month year>')"
+        },
+        "max_artists": {
+            "type": "integer",
+            "description": "Only scan the first N followed/top artists (default: all of them)",
+            "minimum": 1
+        },
+        "max_tracks": {
+            "type": "integer",
+            "description": f"Maximum number of tracks in the playlist (1-{RADAR_MAX_TRACKS})",
+            "minimum": 1,
+            "maximum": RADAR_MAX_TRACKS,
+            "default": 30
+        },
+        "incremental": {
+            "type": "boolean",
+            "description": "Only look for releases newer than the previous radar run and update that run's playlist instead of creating a new one",
+            "default": False
+        },
+        "playlist_mode": {
+            "type": "string",
+            "description": "With incremental, whether new tracks are appended to the previous playlist or replace its content",
+            "enum": ["append", "replace"],
+            "default": "append"
+        }
+    },
+    cancellable=True
+)
+tools.add(
+    "server_stats",
+    "Get latency and Spotify request metrics of this MCP server, per tool and per Spotify endpoint (timings, status codes, retries, cache hits)",
+    server_stats,
+    properties={
+        "reset": {
+            "type": "boolean",
+            "description": "Clear the collected metrics after returning them",
+            "default": False
+        }
+    }
+)
+
 @server.list_tools()
 async def list_tools() -> list[Tool]:
-    return [
-        Tool(
-            name="next_track",
-            description="Skip to next track on active Spotify device",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="previous_track",
-            description="Go to previous track on active Spotify device",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="pause_track",
-            description="Pause playback on active Spotify device",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="resume_track",
-            description="Resume/play playback on active Spotify device",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="current_track",
-            description="Get information about the currently playing track on Spotify",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="search_and_play",
-            description="Search for a song on Spotify and play it immediately",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query for the song (artist, song name, album, etc.)"
-                    }
-                },
-                "required": ["query"]
-            }
-        ),
-        Tool(
-            name="get_top_tracks",
-            description="Get your top tracks from Spotify without playing them",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "time_range": {
-                        "type": "string",
-                        "description": "Time period for top tracks",
-                        "enum": ["short_term", "medium_term", "long_term"],
-                        "default": "medium_term"
-                    },
-                    "limit": {
-                        "type": "integer", 
-                        "description": "Number of top tracks to get (1-50)",
-                        "minimum": 1,
-                        "maximum": 50,
-                        "default": 20
-                    }
-                },
-                "required": []
-            }
-        ),
-        Tool(
-            name="play_top_track",
-            description="Play a random song from your top tracks on Spotify",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "time_range": {
-                        "type": "string",
-                        "description": "Time period for top tracks",
-                        "enum": ["short_term", "medium_term", "long_term"],
-                        "default": "medium_term"
-                    },
-                    "limit": {
-                        "type": "integer", 
-                        "description": "Number of top tracks to choose from (1-50)",
-                        "minimum": 1,
-                        "maximum": 50,
-                        "default": 20
-                    }
-                },
-                "required": []
-            }
-        ),
+    return tools.tools()
 
-    ]
+def prewarm(account):
+    """Importa requests, abre la conexión keep-alive con Spotify y valida (o renueva) el token de la cuenta
+    
+    Usa /me/player, que además deja en caché el dispositivo activo y el estado del reproductor.
+    """
+    with accounts.use(account):
+        get_active_device(use_cache=False)
+
+prewarm_started = False
+
+def start_prewarm():
+    """Precalienta cada cuenta en un worker, una sola vez por proceso (con HTTP hay muchas sesiones)"""
+    global prewarm_started
+    if not PREWARM or prewarm_started:
+        return
+    prewarm_started = True
+    for account in accounts:
+        if account.tokens.has_credentials():
+            tool_executor.submit(prewarm, account)
+
+async def on_initialized(notification):
+    """El cliente completó el handshake: precalienta sin retrasar sus primeras requests"""
+    start_prewarm()
+
+server.notification_handlers[InitializedNotification] = on_initialized
+
+def make_progress_reporter():
+    """Crea un callback (usable desde los workers) que envía notificaciones de progreso MCP
+    
+    Devuelve None si el cliente no pidió progreso (sin progressToken en la request).
+    """
+    try:
+        ctx = server.request_context
+    except LookupError:
+        # Llamada fuera de una request MCP
+        return None
+    progress_token = ctx.meta.progressToken if ctx.meta else None
+    if progress_token is None:
+        return None
+    
+    loop = asyncio.get_running_loop()
+    
+    def report(progress, total=None, message=None):
+        asyncio.run_coroutine_threadsafe(
+            ctx.session.send_progress_notification(progress_token, progress, total=total, message=message),
+            loop
+        )
+    
+    return report
 
 @server.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
-    
-    if name == "next_track":
-        result = next_track()
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "previous_track":
-        result = previous_track()
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "pause_track":
-        result = pause_track()
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "resume_track":
-        result = resume_track()
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "current_track":
-        result = current_track()
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "search_and_play":
-        query = arguments.get("query", "")
-        if not query:
-            error_result = {"success": False, "error": "Se requiere un término de búsqueda"}
-            return [TextContent(type="text", text=json.dumps(error_result, ensure_ascii=False, indent=2))]
-        result = search_and_play(query)
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "get_top_tracks":
-        time_range = arguments.get("time_range", "medium_term")
-        limit = arguments.get("limit", 20)
-        
-        # Validar parámetros
-        if time_range not in ["short_term", "medium_term", "long_term"]:
-            error_result = {"success": False, "error": "time_range debe ser: short_term, medium_term, o long_term"}
-            return [TextContent(type="text", text=json.dumps(error_result, ensure_ascii=False, indent=2))]
-        
-        if not (1 <= limit <= 50):
-            error_result = {"success": False, "error": "limit debe estar entre 1 y 50"}
-            return [TextContent(type="text", text=json.dumps(error_result, ensure_ascii=False, indent=2))]
-            
-        result = get_top_tracks(time_range, limit)
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    elif name == "play_top_track":
-        time_range = arguments.get("time_range", "medium_term")
-        limit = arguments.get("limit", 20)
-        
-        # Validar time_range
-        if time_range not in ["short_term", "medium_term", "long_term"]:
-            error_result = {"success": False, "error": "time_range debe ser: short_term, medium_term, o long_term"}
-            return [TextContent(type="text", text=json.dumps(error_result, ensure_ascii=False, indent=2))]
-        
-        # Validar limit
-        if not (1 <= limit <= 50):
-            error_result = {"success": False, "error": "limit debe estar entre 1 y 50"}
-            return [TextContent(type="text", text=json.dumps(error_result, ensure_ascii=False, indent=2))]
-            
-        result = play_top_track(time_range, limit)
-        return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False, indent=2))]
-    else:
-        error_result = {"success": False, "error": f"Herramienta desconocida: {name}"}
-        return [TextContent(type="text", text=json.dumps(error_result, ensure_ascii=False, indent=2))]
+    arguments = arguments or {}
+    try:
+        fmt, fields = parse_output_options(arguments)
+    except ValueError as e:
+        return [TextContent(type="text", text=render({"success": False, "error": str(e)}))]
+
+    spec = tools.get(name)
+    if spec is None:
+        return [TextContent(type="text", text=render({"success": False, "error": f"Herramienta desconocida: {name}"}, fmt))]
 
-async def main():
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, server.create_initialization_options())
+    try:
+        account = accounts.get(arguments.get("account"))
+    except UnknownAccountError as e:
+        return [TextContent(type="text", text=render({"success": False, "error": str(e)}, fmt))]
+
+    global pending_calls
+    if not accepting_calls:
+        return [TextContent(type="text", text=render(
+            {"success": False, "error": "El servidor se está apagando. Intenta de nuevo en unos segundos."}, fmt
+        ))]
+    if pending_calls >= MAX_PENDING_CALLS:
+        return [TextContent(type="text", text=render(
+            {"success": False, "error": "Servidor ocupado: demasiadas llamadas en curso. Intenta de nuevo en unos segundos."}, fmt
+        ))]
+
+    # La cuenta elegida y la llamada en curso (para las métricas) llegan a los workers vía contextvars
+    pending_calls += 1
+    try:
+        with accounts.use(account), metrics.tool_call(name) as outcome:
+            result = await run_tool(spec, arguments)
+            if outcome is not None and result.get("success") is False:
+                outcome["status"] = "error"
+    finally:
+        pending_calls -= 1
+    # Una sola serialización para todas las herramientas, en el formato pedido
+    return [TextContent(type="text", text=render(result, fmt, fields))]
+
+async def run_tool(spec, arguments):
+    """Valida los argumentos con el esquema de la herramienta y ejecuta su handler en un worker"""
+    try:
+        kwargs = spec.bind(arguments)
+    except ToolArgumentError as e:
+        return {"success": False, "error": str(e)}
+
+    if not spec.cancellable:
+        return await run_in_worker(spec.handler, **kwargs)
+
+    # Si el cliente cancela la request, cancel_event detiene el trabajo HTTP pendiente del worker
+    cancel_event = threading.Event()
+    try:
+        return await run_in_worker(
+            spec.handler, progress=make_progress_reporter(), cancel_event=cancel_event, **kwargs
+        )
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+
+async def drain_calls(timeout):
+    """Deja de admitir llamadas a herramientas y espera (hasta timeout segundos) a que terminen las que están en curso"""
+    global accepting_calls
+    accepting_calls = False
+    deadline = asyncio.get_running_loop().time() + (timeout or 0)
+    while pending_calls and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.1)
+
+async def main(transport=MCP_TRANSPORT, host=None, port=None):
+    try:
+        if transport == 'http':
+            # Un solo proceso para muchos clientes: comparten cachés, conexiones y rate limiter
+            from spotify_http import serve_http, HTTP_HOST, HTTP_PORT
+            await serve_http(server, host or HTTP_HOST, port or HTTP_PORT, on_startup=start_prewarm, drain=drain_calls)
+        else:
+            async with stdio_server() as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, server.create_initialization_options())
+    finally:
+        # Las llamadas canceladas ya avisaron a sus workers (cancel_event); no se espera a los pendientes
+        tool_executor.shutdown(wait=False, cancel_futures=True)
+        accounts.close()
+        metrics.write_file()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Servidor MCP de Spotify")
+    parser.add_argument('--transport', choices=MCP_TRANSPORTS, default=MCP_TRANSPORT if MCP_TRANSPORT in MCP_TRANSPORTS else 'stdio',
+                        help="stdio (por defecto) o http (streamable HTTP para varios clientes)")
+    parser.add_argument('--host', help="Dirección de escucha con --transport http (por defecto 127.0.0.1)")
+    parser.add_argument('--port', type=int, help="Puerto con --transport http (por defecto 8000)")
+    args = parser.parse_args()
+
     # Verificar que el token esté configurado
-    if not ACCESS_TOKEN:
+    if not accounts.has_credentials():
         print(" ERROR: Debes agregar SPOTIFY_ACCESS_TOKEN en el archivo .env")
         print("1. Ejecuta spotify_auth.py para obtener el token")
         print("2. Agrega SPOTIFY_ACCESS_TOKEN=tu_token en .env")
         exit(1)
-    
-    # Modo test directo
-    # import sys
-    # if len(sys.argv) == 1:
-    #     print("Probando next_track...")
-    #     result = next_track()
-    #     print(result)
     else:
         # Modo MCP server (sin prints que interfieran con JSON)
-        import asyncio
-        asyncio.run(main())
+        asyncio.run(main(args.transport, args.host, args.port))
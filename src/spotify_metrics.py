@@ -0,0 +1,300 @@
+import os
+import re
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Instrumentación de herramientas y requests (desactivarla deja solo una comprobación de booleano)
+METRICS_ENABLED = os.getenv('SPOTIFY_METRICS', 'true').lower() in ('1', 'true', 'yes')
+
+# Archivo opcional con las métricas en formato de texto Prometheus y cada cuánto se reescribe
+METRICS_FILE = os.getenv('SPOTIFY_METRICS_FILE')
+METRICS_FILE_INTERVAL = float(os.getenv('SPOTIFY_METRICS_FILE_INTERVAL', '15'))
+
+# Límites superiores de los buckets: segundos de latencia y requests HTTP por llamada a herramienta
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Segmentos de la API cuyo siguiente valor es un ID (se agrupan en la etiqueta del endpoint)
+ID_SEGMENT = re.compile(r'(/(?:artists|albums|tracks|playlists|users|shows|episodes|audiobooks)/)[^/]+')
+
+
+def endpoint_label(path):
+    """Plantilla del endpoint sin IDs ni query string, p. ej. /artists/{id}/albums"""
+    return ID_SEGMENT.sub(r'\1{id}', path.split('?', 1)[0])
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos, compatible con el formato de Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def copy(self):
+        histogram = Histogram(self.buckets)
+        histogram.merge(self)
+        return histogram
+
+    def quantile(self, q):
+        """Estimación del cuantil interpolando dentro del bucket (como histogram_quantile)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self, scale=1.0, digits=1):
+        def scaled(value):
+            return round(value * scale, digits) if value is not None else None
+        return {
+            "count": self.count,
+            "avg": scaled(self.sum / self.count if self.count else None),
+            "p50": scaled(self.quantile(0.5)),
+            "p95": scaled(self.quantile(0.95)),
+            "p99": scaled(self.quantile(0.99))
+        }
+
+
+class ToolCall:
+    """Llamada a herramienta en curso; acumula las requests HTTP que hace (en cualquier hilo)"""
+
+    __slots__ = ('name', 'requests')
+
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+
+
+# Llamada activa del contexto actual; run_in_worker copia el contexto a los hilos del pool
+current_call = contextvars.ContextVar('spotify_tool_call', default=None)
+
+
+class Metrics:
+    """Registro de histogramas y contadores etiquetados, seguro entre hilos"""
+
+    def __init__(self, enabled=METRICS_ENABLED, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL):
+        self.enabled = enabled
+        self.path = path
+        self.interval = interval
+        self.started_at = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._written_at = 0.0
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def tool_call(self, name):
+        """Mide una llamada a herramienta: duración, resultado y requests HTTP que generó"""
+        if not self.enabled:
+            yield None
+            return
+        call = ToolCall(name)
+        token = current_call.set(call)
+        start = time.perf_counter()
+        outcome = {"status": "ok"}
+        try:
+            yield outcome
+        except BaseException as e:
+            outcome["status"] = "cancelled" if type(e).__name__ == 'CancelledError' else "exception"
+            raise
+        finally:
+            current_call.reset(token)
+            labels = (('tool', name), ('status', outcome["status"]))
+            self.observe('spotify_tool_duration_seconds', labels, time.perf_counter() - start)
+            self.observe('spotify_tool_requests', (('tool', name),), call.requests, COUNT_BUCKETS)
+            self.maybe_write_file()
+
+    def record_request(self, method, path, status, elapsed, attempt):
+        """Registra un intento HTTP contra Spotify, atribuido a la herramienta que lo originó"""
+        call = current_call.get()
+        tool = call.name if call is not None else ''
+        if call is not None:
+            with self._lock:
+                call.requests += 1
+        endpoint = endpoint_label(path)
+        self.observe('spotify_request_duration_seconds',
+                     (('tool', tool), ('method', method), ('endpoint', endpoint), ('status', str(status))), elapsed)
+        if attempt:
+            self.inc('spotify_request_retries_total', (('tool', tool), ('endpoint', endpoint), ('status', str(status))))
+
+    def record_cache(self, path, result):
+        call = current_call.get()
+        self.inc('spotify_cache_lookups_total',
+                 (('tool', call.name if call is not None else ''), ('endpoint', endpoint_label(path)), ('result', result)))
+
+    def record_shared(self, path):
+        """Un GET que reutilizó la respuesta de una request idéntica en vuelo (single-flight)"""
+        call = current_call.get()
+        self.inc('spotify_shared_requests_total',
+                 (('tool', call.name if call is not None else ''), ('endpoint', endpoint_label(path))))
+
+    def record_wait(self, reason, seconds):
+        """Tiempo bloqueado por el rate limiter o esperando un reintento"""
+        if seconds > 0:
+            self.observe('spotify_wait_seconds', (('reason', reason),), seconds)
+
+    def snapshot(self):
+        """Resumen legible (latencias en ms) por herramienta y por endpoint"""
+        with self._lock:
+            histograms = [(key, histogram.copy()) for key, histogram in self._histograms.items()]
+            counters = dict(self._counters)
+
+        tools = {}
+        requests = {}
+        waits = {}
+        for (name, labels), histogram in histograms:
+            label = dict(labels)
+            if name == 'spotify_tool_duration_seconds':
+                tools.setdefault(label['tool'], {})[label['status']] = histogram.summary(1000)
+            elif name == 'spotify_tool_requests':
+                tools.setdefault(label['tool'], {})['requests_per_call'] = histogram.summary()
+            elif name == 'spotify_request_duration_seconds':
+                # Se agrupa por endpoint (todas las herramientas) y por herramienta + endpoint
+                key = f"{label['method']} {label['endpoint']}"
+                scopes = [requests]
+                if label['tool']:
+                    scopes.append(tools.setdefault(label['tool'], {}).setdefault('requests', {}))
+                for scope in scopes:
+                    merged, statuses = scope.setdefault(key, (Histogram(histogram.buckets), {}))
+                    merged.merge(histogram)
+                    statuses[label['status']] = statuses.get(label['status'], 0) + histogram.count
+            elif name == 'spotify_wait_seconds':
+                waits[label['reason']] = histogram.summary(1000)
+
+        def endpoints(scope):
+            return {key: dict(merged.summary(1000), statuses=statuses) for key, (merged, statuses) in scope.items()}
+
+        requests = endpoints(requests)
+        for tool in tools.values():
+            if 'requests' in tool:
+                tool['requests'] = endpoints(tool['requests'])
+
+        retries = {}
+        cache = {}
+        shared = {}
+        for (name, labels), value in counters.items():
+            label = dict(labels)
+            if name == 'spotify_request_retries_total':
+                key = f"{label['endpoint']} {label['status']}"
+                retries[key] = retries.get(key, 0) + value
+            elif name == 'spotify_cache_lookups_total':
+                entry = cache.setdefault(label['endpoint'], {})
+                entry[label['result']] = entry.get(label['result'], 0) + value
+            elif name == 'spotify_shared_requests_total':
+                shared[label['endpoint']] = shared.get(label['endpoint'], 0) + value
+
+        return {
+            "enabled": self.enabled,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "tools": tools,
+            "requests": requests,
+            "retries": retries,
+            "cache": cache,
+            "shared_in_flight": shared,
+            "waits_ms": waits
+        }
+
+    def to_prometheus(self):
+        """Métricas en el formato de texto de Prometheus (apto para el textfile collector de node_exporter)"""
+        with self._lock:
+            histograms = [(key, list(h.counts), h.count, h.sum, h.buckets) for key, h in self._histograms.items()]
+            counters = list(self._counters.items())
+
+        def fmt(labels, extra=()):
+            pairs = [f'{k}="{escape(v)}"' for k, v in tuple(labels) + tuple(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        declared = set()
+        for (name, labels), counts, count, total, buckets in sorted(histograms, key=lambda h: h[0]):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{name}_bucket{fmt(labels, (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{fmt(labels)} {total}')
+            lines.append(f'{name}_count{fmt(labels)} {count}')
+        for (name, labels), value in sorted(counters):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{fmt(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_file(self):
+        """Escribe el archivo de métricas de forma atómica (tmp + rename)"""
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def maybe_write_file(self):
+        if not self.path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._written_at < self.interval:
+                return
+            self._written_at = now
+        self.write_file()
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+        self.started_at = time.time()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Registro del proceso, compartido por el cliente HTTP y el servidor MCP
+metrics = Metrics()
@@ -0,0 +1,473 @@
+"""Servidor local que imita los endpoints de la Web API de Spotify usados por spotify_mcp.py
+
+Permite ejercitar las herramientas sin cuenta real y medir cuántas requests y cuánta
+latencia cuesta cada una. Inyecta latencia, respuestas 429 y errores 5xx configurables.
+
+Uso:
+    python src/spotify_mock_api.py --port 8765 --latency-ms 80 --rate-429 0.05
+    SPOTIFY_API_BASE_URL=http://127.0.0.1:8765/v1 SPOTIFY_TOKEN_URL=http://127.0.0.1:8765/api/token \
+        SPOTIFY_ACCESS_TOKEN=mock python src/spotify_mcp.py
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+class MockLibrary:
+    """Catálogo y biblioteca sintéticos (deterministas) de un usuario de prueba"""
+
+    def __init__(self, artists=60, albums_per_artist=6, tracks_per_album=8, top_tracks=120, seed=7):
+        rng = random.Random(seed)
+        today = datetime.now()
+        self.user = {"id": "mock-user", "display_name": "Mock User", "external_urls": {"spotify": "https://open.spotify.com/user/mock-user"}}
+        self.devices = [{"id": "mock-device", "name": "Mock Speaker", "type": "Speaker", "is_active": True, "volume_percent": 50}]
+        self.artists = []
+        self.albums = {}
+        self.tracks = {}
+        self.playlists = {}
+        self.queue = []
+        self.player = {"is_playing": False, "progress_ms": 0, "item": None, "shuffle_state": False, "repeat_state": "off"}
+
+        for a in range(artists):
+            artist = {"id": f"artist{a}", "name": f"Mock Artist {a}", "uri": f"spotify:artist:artist{a}", "type": "artist"}
+            self.artists.append(artist)
+            for b in range(albums_per_artist):
+                group = 'single' if b % 2 else 'album'
+                # Algunos lanzamientos recientes y el resto repartidos en los últimos años
+                days_ago = rng.randint(0, 20) if b == 0 else rng.randint(30, 2000)
+                album_id = f"album{a}x{b}"
+                album = {
+                    "id": album_id, "name": f"Mock Album {a}-{b}", "album_type": group, "album_group": group,
+                    "release_date": (today - timedelta(days=days_ago)).strftime('%Y-%m-%d'),
+                    "release_date_precision": "day", "artists": [artist], "uri": f"spotify:album:{album_id}",
+                    "external_urls": {"spotify": f"https://open.spotify.com/album/{album_id}"}
+                }
+                album_tracks = []
+                for t in range(tracks_per_album if group == 'album' else 2):
+                    track_id = f"track{a}x{b}x{t}"
+                    track = {
+                        "id": track_id, "name": f"Mock Song {a}-{b}-{t}", "uri": f"spotify:track:{track_id}",
+                        "artists": [artist], "duration_ms": rng.randint(120000, 300000),
+                        "popularity": rng.randint(0, 100), "track_number": t + 1, "type": "track"
+                    }
+                    self.tracks[track_id] = dict(track, album={k: album[k] for k in ("id", "name", "release_date", "uri")})
+                    album_tracks.append(track)
+                album["tracks"] = album_tracks
+                self.albums[album_id] = album
+
+        track_ids = sorted(self.tracks)
+        rng.shuffle(track_ids)
+        self.top_tracks = [self.tracks[t] for t in track_ids[:top_tracks]]
+        # Canciones guardadas de la más reciente a la más antigua, como /me/tracks
+        self.saved_tracks = [
+            {"added_at": (today - timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%SZ'), "track": self.tracks[t]}
+            for i, t in enumerate(track_ids[top_tracks:top_tracks * 2])
+        ]
+        self.followed = self.artists[: max(1, artists * 2 // 3)]
+        self.top_artists = self.artists[artists // 3:]
+
+
+class MockState:
+    """Configuración de fallos y contadores compartidos por todos los hilos del servidor"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, retry_after=1, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.library = MockLibrary()
+
+    def record(self, endpoint):
+        with self.lock:
+            self.counts[endpoint] += 1
+
+    def stats(self):
+        with self.lock:
+            return {"total": sum(self.counts.values()), "endpoints": dict(self.counts)}
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+def page(items, query, base_url):
+    """Página estilo Spotify (offset/limit) con la URL de la siguiente"""
+    limit = int(query.get('limit', 20))
+    offset = int(query.get('offset', 0))
+    chunk = items[offset:offset + limit]
+    next_url = None
+    if offset + limit < len(items):
+        next_url = f"{base_url}?{urlencode(dict(query, offset=offset + limit, limit=limit))}"
+    return {"items": chunk, "total": len(items), "limit": limit, "offset": offset, "next": next_url}
+
+
+def simplified_album(album):
+    return {k: v for k, v in album.items() if k != 'tracks'}
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    server_version = "MockSpotify/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        if payload:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def _error(self, status, message, reason=None):
+        error = {"status": status, "message": message}
+        if reason:
+            error["reason"] = reason
+        self._send(status, {"error": error})
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return dict((k, v[0]) for k, v in parse_qs(raw.decode()).items())
+
+    def _handle(self, method):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        body = self._body() if method in ('POST', 'PUT') else {}
+
+        if path.startswith('/_mock/'):
+            return self._control(method, path)
+
+        route, handler = self._route(method, path)
+        self.state.record(f"{method} {route}")
+
+        state = self.state
+        delay = max(0.0, state.latency_ms + state.random.uniform(-state.jitter_ms, state.jitter_ms))
+        if delay:
+            time.sleep(delay / 1000)
+        if state.rate_429 and state.random.random() < state.rate_429:
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                              {"Retry-After": str(state.retry_after)})
+        if state.error_rate and state.random.random() < state.error_rate:
+            return self._error(503, "Service unavailable")
+        if handler is None:
+            return self._error(404, "Service not found")
+        if not path.startswith('/api/') and not (self.headers.get('Authorization') or '').startswith('Bearer '):
+            return self._error(401, "No token provided")
+        return handler(query, body, path)
+
+    def _control(self, method, path):
+        if path == '/_mock/stats':
+            return self._send(200, self.state.stats())
+        if path == '/_mock/reset' and method == 'POST':
+            self.state.reset()
+            return self._send(204)
+        return self._error(404, "Unknown control endpoint")
+
+    def _route(self, method, path):
+        """Devuelve (nombre del endpoint para las estadísticas, función)"""
+        parts = path.rstrip('/').split('/')
+        routes = {
+            ('POST', '/api/token'): self.token,
+            ('GET', '/v1/me'): self.me,
+            ('GET', '/v1/me/player'): self.player,
+            ('GET', '/v1/me/player/devices'): self.devices,
+            ('GET', '/v1/me/player/currently-playing'): self.currently_playing,
+            ('PUT', '/v1/me/player/play'): self.play,
+            ('PUT', '/v1/me/player/pause'): self.pause,
+            ('POST', '/v1/me/player/next'): self.skip,
+            ('POST', '/v1/me/player/previous'): self.skip,
+            ('POST', '/v1/me/player/queue'): self.enqueue,
+            ('GET', '/v1/search'): self.search,
+            ('GET', '/v1/me/top/tracks'): self.top_tracks,
+            ('GET', '/v1/me/top/artists'): self.top_artists,
+            ('GET', '/v1/me/following'): self.following,
+            ('GET', '/v1/me/tracks'): self.saved_tracks,
+            ('GET', '/v1/me/playlists'): self.my_playlists,
+            ('GET', '/v1/albums'): self.albums,
+        }
+        key = (method, path.rstrip('/'))
+        if key in routes:
+            return key[1], routes[key]
+        if len(parts) == 5 and parts[2] == 'artists' and parts[4] == 'albums' and method == 'GET':
+            return '/v1/artists/{id}/albums', self.artist_albums
+        if len(parts) == 5 and parts[2] == 'albums' and parts[4] == 'tracks' and method == 'GET':
+            return '/v1/albums/{id}/tracks', self.album_tracks
+        if len(parts) == 5 and parts[2] == 'users' and parts[4] == 'playlists' and method == 'POST':
+            return '/v1/users/{id}/playlists', self.create_playlist
+        if len(parts) == 4 and parts[2] == 'playlists' and method == 'GET':
+            return '/v1/playlists/{id}', self.get_playlist
+        if len(parts) == 5 and parts[2] == 'playlists' and parts[4] == 'tracks':
+            return f'/v1/playlists/{{id}}/tracks', {
+                'GET': self.playlist_tracks, 'POST': self.add_playlist_tracks, 'PUT': self.replace_playlist_tracks
+            }.get(method)
+        return path, None
+
+    # --- Auth y usuario ---
+
+    def token(self, query, body, path):
+        return self._send(200, {"access_token": f"mock-{time.time()}", "token_type": "Bearer", "expires_in": 3600})
+
+    def me(self, query, body, path):
+        return self._send(200, self.state.library.user)
+
+    # --- Reproducción ---
+
+    def player(self, query, body, path):
+        library = self.state.library
+        return self._send(200, dict(library.player, device=library.devices[0], timestamp=int(time.time() * 1000)))
+
+    def devices(self, query, body, path):
+        return self._send(200, {"devices": self.state.library.devices})
+
+    def currently_playing(self, query, body, path):
+        player = self.state.library.player
+        if not player["item"]:
+            return self._send(204)
+        return self._send(200, dict(player, timestamp=int(time.time() * 1000)))
+
+    def _check_device(self, query):
+        device_id = query.get('device_id')
+        if device_id and device_id not in {d['id'] for d in self.state.library.devices}:
+            self._error(404, "Device not found", "NO_ACTIVE_DEVICE")
+            return False
+        return True
+
+    def play(self, query, body, path):
+        if not self._check_device(query):
+            return
+        library = self.state.library
+        uris = body.get('uris') or []
+        if uris:
+            track_id = uris[0].rsplit(':', 1)[-1]
+            library.player["item"] = library.tracks.get(track_id)
+            library.player["progress_ms"] = body.get('position_ms', 0)
+        library.player["is_playing"] = True
+        return self._send(204)
+
+    def pause(self, query, body, path):
+        if not self._check_device(query):
+            return
+        self.state.library.player["is_playing"] = False
+        return self._send(204)
+
+    def skip(self, query, body, path):
+        if not self._check_device(query):
+            return
+        library = self.state.library
+        if library.queue:
+            library.player["item"] = library.tracks.get(library.queue.pop(0).rsplit(':', 1)[-1])
+        library.player["progress_ms"] = 0
+        return self._send(204)
+
+    def enqueue(self, query, body, path):
+        if not self._check_device(query):
+            return
+        if not query.get('uri'):
+            return self._error(400, "Missing uri")
+        self.state.library.queue.append(query['uri'])
+        return self._send(204)
+
+    # --- Catálogo y biblioteca ---
+
+    def search(self, query, body, path):
+        words = [w for w in query.get('q', '').lower().replace('"', ' ').replace(':', ' ').split() if w not in ('artist', 'track')]
+        tracks = list(self.state.library.tracks.values())
+        matches = [t for t in tracks if all(w in f"{t['name']} {t['artists'][0]['name']}".lower() for w in words)]
+        result = page(matches, dict(query, limit=query.get('limit', 20)), self._base('/v1/search'))
+        return self._send(200, {"tracks": result})
+
+    def top_tracks(self, query, body, path):
+        return self._send(200, page(self.state.library.top_tracks, query, self._base(path)))
+
+    def top_artists(self, query, body, path):
+        return self._send(200, page(self.state.library.top_artists, query, self._base(path)))
+
+    def saved_tracks(self, query, body, path):
+        return self._send(200, page(self.state.library.saved_tracks, query, self._base(path)))
+
+    def my_playlists(self, query, body, path):
+        playlists = [dict(p, tracks={"total": len(p["items"])}, snapshot_id=f"snapshot{len(p['items'])}")
+                     for p in self.state.library.playlists.values()]
+        playlists = [{k: v for k, v in p.items() if k != 'items'} for p in playlists]
+        return self._send(200, page(playlists, query, self._base(path)))
+
+    def following(self, query, body, path):
+        # Paginación por cursor como la API real
+        artists = self.state.library.followed
+        limit = int(query.get('limit', 20))
+        after = query.get('after')
+        start = next((i + 1 for i, a in enumerate(artists) if a['id'] == after), 0) if after else 0
+        chunk = artists[start:start + limit]
+        next_url = None
+        if start + limit < len(artists):
+            next_url = f"{self._base(path)}?{urlencode({'type': 'artist', 'limit': limit, 'after': chunk[-1]['id']})}"
+        return self._send(200, {"artists": {"items": chunk, "next": next_url, "total": len(artists),
+                                            "cursors": {"after": chunk[-1]['id'] if chunk else None}}})
+
+    def artist_albums(self, query, body, path):
+        artist_id = path.split('/')[3]
+        groups = (query.get('include_groups') or query.get('album_type') or 'album,single').split(',')
+        albums = [simplified_album(a) for a in self.state.library.albums.values()
+                  if a['artists'][0]['id'] == artist_id and a['album_group'] in groups]
+        # Igual que Spotify: agrupados por tipo y del más reciente al más antiguo
+        albums.sort(key=lambda a: (groups.index(a['album_group']), [-ord(c) for c in a['release_date']]))
+        return self._send(200, page(albums, query, self._base(path)))
+
+    def album_tracks(self, query, body, path):
+        album = self.state.library.albums.get(path.split('/')[3])
+        if not album:
+            return self._error(404, "Non existing id")
+        return self._send(200, page(album['tracks'], query, self._base(path)))
+
+    def albums(self, query, body, path):
+        ids = [i for i in query.get('ids', '').split(',') if i]
+        if len(ids) > 20:
+            return self._error(400, "Too many ids requested")
+        albums = []
+        for album_id in ids:
+            album = self.state.library.albums.get(album_id)
+            albums.append(dict(simplified_album(album), tracks=page(album['tracks'], {'limit': 50}, '')) if album else None)
+        return self._send(200, {"albums": albums})
+
+    # --- Playlists ---
+
+    def create_playlist(self, query, body, path):
+        library = self.state.library
+        playlist_id = f"playlist{len(library.playlists)}"
+        playlist = {
+            "id": playlist_id, "name": body.get('name', 'Untitled'), "public": body.get('public', True),
+            "uri": f"spotify:playlist:{playlist_id}", "owner": library.user,
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"}, "items": []
+        }
+        library.playlists[playlist_id] = playlist
+        return self._send(201, {k: v for k, v in playlist.items() if k != 'items'})
+
+    def _playlist(self, path):
+        playlist = self.state.library.playlists.get(path.split('/')[3])
+        if playlist is None:
+            self._error(404, "Not found")
+        return playlist
+
+    def get_playlist(self, query, body, path):
+        playlist = self._playlist(path)
+        if playlist is not None:
+            return self._send(200, dict({k: v for k, v in playlist.items() if k != 'items'},
+                                        tracks={"total": len(playlist["items"])}))
+
+    def playlist_tracks(self, query, body, path):
+        playlist = self._playlist(path)
+        if playlist is not None:
+            items = [{"track": self.state.library.tracks.get(uri.rsplit(':', 1)[-1])} for uri in playlist["items"]]
+            return self._send(200, page(items, query, self._base(path)))
+
+    def add_playlist_tracks(self, query, body, path):
+        playlist = self._playlist(path)
+        if playlist is None:
+            return
+        uris = body.get('uris') or []
+        if len(uris) > 100:
+            return self._error(400, "You can add a maximum of 100 tracks per request.")
+        position = body.get('position')
+        if position is None:
+            playlist["items"].extend(uris)
+        elif position > len(playlist["items"]):
+            return self._error(400, "Index out of bounds")
+        else:
+            playlist["items"][position:position] = uris
+        return self._send(201, {"snapshot_id": f"snapshot{len(playlist['items'])}"})
+
+    def replace_playlist_tracks(self, query, body, path):
+        playlist = self._playlist(path)
+        if playlist is None:
+            return
+        uris = body.get('uris') or []
+        if len(uris) > 100:
+            return self._error(400, "You can set a maximum of 100 tracks per request.")
+        playlist["items"] = list(uris)
+        return self._send(200, {"snapshot_id": f"snapshot{len(playlist['items'])}"})
+
+    def _base(self, path):
+        return f"http://{self.headers.get('Host')}{path}"
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class MockSpotifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), state=None):
+        super().__init__(address, MockSpotifyHandler)
+        self.state = state or MockState()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Arranca el servidor en un hilo en segundo plano y devuelve la URL base"""
+        thread = threading.Thread(target=self.serve_forever, name='spotify-mock-api', daemon=True)
+        thread.start()
+        return self.base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la Web API de Spotify")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latencia añadida a cada request")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Variación aleatoria de la latencia (±)")
+    parser.add_argument('--rate-429', type=float, default=0, help="Probabilidad de responder 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Valor de Retry-After en los 429")
+    parser.add_argument('--error-rate', type=float, default=0, help="Probabilidad de responder 503")
+    args = parser.parse_args()
+
+    state = MockState(args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.error_rate)
+    server = MockSpotifyServer((args.host, args.port), state)
+    print(f"Mock Spotify API en {server.base_url}/v1 (token en {server.base_url}/api/token)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
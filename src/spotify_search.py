@@ -0,0 +1,471 @@
+import os
+import re
+import json
+import time
+import bisect
+import threading
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+from spotify_client import RateLimiter, background_limiter
+
+load_dotenv()
+
+# Índice local de la biblioteca del usuario para resolver búsquedas sin llamar a /search
+LIBRARY_INDEX_ENABLED = os.getenv('SPOTIFY_LIBRARY_INDEX', 'true').lower() in ('1', 'true', 'yes')
+
+# Segundos tras los que una búsqueda dispara (en segundo plano) la actualización incremental del índice
+LIBRARY_INDEX_TTL = float(os.getenv('SPOTIFY_LIBRARY_INDEX_TTL', '600'))
+
+# Cada cuánto se reconstruye todo (detecta canciones quitadas de la biblioteca o de los top)
+LIBRARY_INDEX_FULL_REFRESH = 6 * 3600
+
+# Requests por segundo de la carga del índice (cientos en la primera, con bibliotecas grandes), además
+# del límite global: la actualización en segundo plano no frena a los comandos de reproducción
+LIBRARY_INDEX_RATE_LIMIT = float(os.getenv('SPOTIFY_LIBRARY_INDEX_RATE_LIMIT', '2'))
+library_index_limiter = RateLimiter(LIBRARY_INDEX_RATE_LIMIT, burst=2)
+
+# Caché de búsquedas normalizadas: entradas máximas, TTL de resultados y TTL de búsquedas sin resultados
+SEARCH_CACHE_SIZE = int(os.getenv('SPOTIFY_SEARCH_CACHE_SIZE', '512'))
+SEARCH_CACHE_TTL = float(os.getenv('SPOTIFY_SEARCH_CACHE_TTL', str(6 * 3600)))
+SEARCH_CACHE_NEGATIVE_TTL = float(os.getenv('SPOTIFY_SEARCH_CACHE_NEGATIVE_TTL', '600'))
+
+# Límites de lo que se indexa para acotar el costo de la primera carga
+LIBRARY_MAX_SAVED = 2000
+LIBRARY_MAX_PLAYLISTS = 50
+LIBRARY_MAX_PLAYLIST_TRACKS = 500
+LIBRARY_TOP_RANGES = ('short_term', 'medium_term', 'long_term')
+
+# Campos mínimos de cada item de playlist (los álbumes completos no hacen falta)
+PLAYLIST_TRACK_FIELDS = 'items(track(id,uri,name,type,is_local,duration_ms,popularity,artists(name),album(name))),next'
+
+# Peso de cada tipo de coincidencia entre un término de la búsqueda y uno del índice
+EXACT_MATCH = 1.0
+FUZZY_MATCH = 0.8
+PREFIX_MATCH = 0.6
+
+# Palabras de la búsqueda que pueden faltar en la canción ("hello by lionel richie")
+QUERY_STOPWORDS = frozenset({'by', 'the'})
+
+# Preferencia entre canciones igual de parecidas según de dónde viene
+SOURCE_BONUS = {'top': 0.3, 'saved': 0.2, 'playlist': 0.1}
+
+# Sufijos de versión que no forman parte del nombre "real" de la canción
+VERSION_SUFFIX = re.compile(r'\s+-\s+.*$|\s*[\(\[].*?[\)\]]')
+
+
+def normalize_tokens(text):
+    """Minúsculas, sin acentos ni puntuación, separado en palabras"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^\w]+|_", ' ', text.replace("'", '')).split()
+
+
+def deletes(token):
+    """Variantes del término con una letra menos (coincidencia difusa a distancia 1)"""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def compact_track(track):
+    """Subconjunto del track que necesitan search_and_play y el estado del reproductor"""
+    return {
+        "id": track.get('id'),
+        "uri": track['uri'],
+        "name": track['name'],
+        "artists": [{"name": a.get('name', '')} for a in track.get('artists') or []],
+        "album": {"name": (track.get('album') or {}).get('name', '')},
+        "duration_ms": track.get('duration_ms', 0),
+        "popularity": track.get('popularity', 0)
+    }
+
+
+class LibraryIndex:
+    """Índice invertido en memoria de los top tracks, canciones guardadas y playlists del usuario
+
+    Cada término normalizado apunta a los URIs que lo contienen (nombre, artistas o álbum).
+    Las búsquedas aceptan coincidencias exactas, difusas (una letra de diferencia) y por prefijo;
+    solo se acepta un resultado si la búsqueda cubre todo el nombre de la canción.
+    La actualización es incremental y corre en segundo plano: una búsqueda nunca espera por la red.
+    """
+
+    def __init__(self, client, ttl=LIBRARY_INDEX_TTL, enabled=LIBRARY_INDEX_ENABLED):
+        self.client = client
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._docs = {}
+        self._postings = {}
+        self._deletes = {}
+        self._vocabulary = []
+        self._sources = {}
+        self._saved_added_at = {}
+        self._playlist_snapshots = {}
+        self._refreshed_at = 0.0
+        self._full_refreshed_at = 0.0
+        self._refreshing = False
+        self.hits = 0
+        self.misses = 0
+        self.last_error = None
+
+    # --- Búsqueda ---
+
+    def _matches(self, token):
+        """{término del índice: peso} que coinciden con un término de la búsqueda"""
+        matches = {}
+        if token in self._postings:
+            matches[token] = EXACT_MATCH
+        if len(token) >= 4:
+            for variant in deletes(token) | {token}:
+                if variant != token and variant in self._postings:
+                    matches.setdefault(variant, FUZZY_MATCH)
+                for candidate in self._deletes.get(variant, ()):
+                    matches.setdefault(candidate, FUZZY_MATCH)
+            start = bisect.bisect_left(self._vocabulary, token)
+            for candidate in self._vocabulary[start:start + 20]:
+                if not candidate.startswith(token):
+                    break
+                matches.setdefault(candidate, PREFIX_MATCH)
+        return matches
+
+    def lookup(self, query):
+        """Track (compacto) de la biblioteca que corresponde a la búsqueda, o None si no hay uno claro"""
+        if not self.enabled:
+            return None
+        self.maybe_refresh()
+
+        tokens = list(dict.fromkeys(normalize_tokens(query)))
+        if not tokens:
+            return None
+
+        with self._lock:
+            if not self._docs:
+                self.misses += 1
+                return None
+
+            # Mejor peso por término del índice y, por documento, términos de la búsqueda que contiene
+            token_weights = {}
+            matched = {}
+            for token in tokens:
+                for term, weight in self._matches(token).items():
+                    if weight > token_weights.get(term, 0):
+                        token_weights[term] = weight
+                    for uri in self._postings.get(term, ()):
+                        best = matched.setdefault(uri, {})
+                        if weight > best.get(token, 0):
+                            best[token] = weight
+
+            # Cada palabra de la búsqueda (salvo las de relleno) tiene que estar en la canción:
+            # "hello adele" no es el "Hello" de Lionel Richie aunque "adele" no esté en el índice
+            required = [token for token in tokens if token not in QUERY_STOPWORDS] or tokens
+            best_doc = None
+            best_score = 0.0
+            for uri, query_weights in matched.items():
+                if not all(token in query_weights for token in required):
+                    continue
+                doc = self._docs[uri]
+                # Todo el nombre (sin sufijos de versión) tiene que estar en la búsqueda
+                if not all(term in token_weights for term in doc['name_tokens']):
+                    continue
+                score = sum(query_weights.values()) + max(SOURCE_BONUS[s.split(':')[0]] for s in doc['sources'])
+                score += doc['track'].get('popularity', 0) / 10000
+                if score > best_score:
+                    best_doc, best_score = doc, score
+
+            if best_doc is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best_doc['track']
+
+    # --- Construcción del índice ---
+
+    def _add(self, track, source):
+        """Agrega (o marca con otra fuente) un track; requiere self._lock"""
+        uri = track['uri']
+        doc = self._docs.get(uri)
+        if doc is None:
+            track = compact_track(track)
+            terms = set(normalize_tokens(track['name']))
+            for artist in track['artists']:
+                terms.update(normalize_tokens(artist['name']))
+            terms.update(normalize_tokens(track['album']['name']))
+            core_name = VERSION_SUFFIX.sub('', track['name']) or track['name']
+            doc = self._docs[uri] = {
+                "track": track,
+                "terms": terms,
+                "name_tokens": set(normalize_tokens(core_name)) or terms,
+                "sources": set()
+            }
+            for term in terms:
+                self._postings.setdefault(term, set()).add(uri)
+        doc['sources'].add(source)
+        self._sources.setdefault(source, set()).add(uri)
+
+    def _drop_source(self, source):
+        """Quita una fuente completa (p. ej. una playlist que cambió); requiere self._lock"""
+        for uri in self._sources.pop(source, ()):
+            doc = self._docs.get(uri)
+            if doc is None:
+                continue
+            doc['sources'].discard(source)
+            if not doc['sources']:
+                del self._docs[uri]
+                for term in doc['terms']:
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.discard(uri)
+                        if not postings:
+                            del self._postings[term]
+
+    def _replace_source(self, source, tracks):
+        with self._lock:
+            self._drop_source(source)
+            for track in tracks:
+                self._add(track, source)
+
+    def _rebuild_fuzzy(self):
+        """Recalcula el vocabulario ordenado (prefijos) y las variantes de una letra menos (difusas)"""
+        with self._lock:
+            vocabulary = sorted(self._postings)
+        variants = {}
+        for term in vocabulary:
+            if len(term) >= 4:
+                for variant in deletes(term):
+                    variants.setdefault(variant, set()).add(term)
+        with self._lock:
+            self._vocabulary = vocabulary
+            self._deletes = variants
+
+    @staticmethod
+    def _is_track(track):
+        return bool(track) and track.get('type', 'track') == 'track' and not track.get('is_local') and track.get('uri')
+
+    def _refresh_top(self):
+        tracks = []
+        for time_range in LIBRARY_TOP_RANGES:
+            params = {'time_range': time_range, 'limit': 50}
+            for page in self.client.paginate('/me/top/tracks', params=params, max_items=100):
+                tracks.extend(t for t in page if self._is_track(t))
+        self._replace_source('top', tracks)
+
+    def _refresh_saved(self, full):
+        """Canciones guardadas: solo las agregadas desde la última vez, salvo que falte alguna"""
+        newest = max(self._saved_added_at.values(), default='')
+        new_items = []
+        total = None
+        url = '/me/tracks'
+        params = {'limit': 50}
+        while url and len(new_items) < LIBRARY_MAX_SAVED:
+            response = self.client.get(url, params=params)
+            if response.status_code != 200:
+                raise RuntimeError(f"/me/tracks: HTTP {response.status_code}")
+            page = response.json()
+            total = page.get('total', 0)
+            reached_known = False
+            for item in page.get('items') or []:
+                # Vienen de la más reciente a la más antigua
+                if not full and newest and item.get('added_at', '') <= newest:
+                    reached_known = True
+                    break
+                if self._is_track(item.get('track')):
+                    new_items.append(item)
+            url = None if reached_known else page.get('next')
+            params = None
+
+        if not full and len(self._saved_added_at) + len(new_items) > (total or 0):
+            # Se quitaron canciones de la biblioteca: recargar todas
+            return self._refresh_saved(full=True)
+
+        with self._lock:
+            if full:
+                self._drop_source('saved')
+                self._saved_added_at = {}
+            for item in new_items:
+                self._add(item['track'], 'saved')
+                self._saved_added_at[item['track']['uri']] = item.get('added_at', '')
+
+    def _refresh_playlists(self):
+        """Solo vuelve a leer las playlists cuyo snapshot_id cambió"""
+        playlists = []
+        for page in self.client.paginate('/me/playlists', params={'limit': 50}, max_items=LIBRARY_MAX_PLAYLISTS):
+            playlists.extend(p for p in page if p)
+
+        current = {p['id']: p.get('snapshot_id') for p in playlists}
+        for playlist_id in set(self._playlist_snapshots) - set(current):
+            with self._lock:
+                self._drop_source(f'playlist:{playlist_id}')
+            del self._playlist_snapshots[playlist_id]
+
+        for playlist_id, snapshot_id in current.items():
+            if snapshot_id and self._playlist_snapshots.get(playlist_id) == snapshot_id:
+                continue
+            tracks = []
+            params = {'limit': 100, 'fields': PLAYLIST_TRACK_FIELDS}
+            for page in self.client.paginate(f'/playlists/{playlist_id}/tracks', params=params,
+                                             max_items=LIBRARY_MAX_PLAYLIST_TRACKS):
+                tracks.extend(item['track'] for item in page if item and self._is_track(item.get('track')))
+            self._replace_source(f'playlist:{playlist_id}', tracks)
+            self._playlist_snapshots[playlist_id] = snapshot_id
+
+    def refresh(self):
+        """Actualiza el índice (bloqueante); las fuentes que fallan conservan su contenido anterior"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        limiter_token = background_limiter.set(library_index_limiter)
+        try:
+            now = time.monotonic()
+            full = now - self._full_refreshed_at > LIBRARY_INDEX_FULL_REFRESH
+            errors = []
+            for name, refresh in (('top', self._refresh_top), ('saved', lambda: self._refresh_saved(full)),
+                                  ('playlists', self._refresh_playlists)):
+                try:
+                    refresh()
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+            self._rebuild_fuzzy()
+            self.last_error = '; '.join(errors) or None
+            self._refreshed_at = time.monotonic()
+            if full and not errors:
+                self._full_refreshed_at = now
+        finally:
+            background_limiter.reset(limiter_token)
+            self._refreshing = False
+            self._refresh_lock.release()
+
+    def maybe_refresh(self):
+        """Lanza la actualización en segundo plano si el índice está vencido"""
+        if not self.enabled or self._refreshing or time.monotonic() - self._refreshed_at < self.ttl:
+            return
+        self._refreshing = True
+        threading.Thread(target=self.refresh, name='spotify-library-index', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "enabled": self.enabled,
+                "tracks": len(self._docs),
+                "terms": len(self._postings),
+                "playlists": len(self._playlist_snapshots),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+        if self._refreshed_at:
+            stats["age_seconds"] = round(time.monotonic() - self._refreshed_at, 1)
+        if self.last_error:
+            stats["last_error"] = self.last_error
+        return stats
+
+
+class SearchCache:
+    """Memoria de búsquedas de canciones con la consulta normalizada como clave
+
+    "Bohemian Rhapsody queen" y "queen  bohemian rhapsody" comparten entrada: se ignoran
+    mayúsculas, acentos, espacios y el orden de las palabras. El mercado forma parte de la clave.
+    Las búsquedas sin resultados también se guardan, con un TTL más corto. Con un store en disco
+    (DiskCache) los resultados sobreviven a reinicios; namespace separa cachés que comparten archivo.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, negative_ttl=SEARCH_CACHE_NEGATIVE_TTL,
+                 store=None, namespace='search'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.store = store
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(query, market):
+        return (market or '', tuple(sorted(normalize_tokens(query))))
+
+    def _store_key(self, key):
+        market, tokens = key
+        return f"{self.namespace}:{market}:{' '.join(tokens)}"
+
+    def _load(self, key):
+        """(encontrada, valor) del store en disco; la entrada vuelve a la memoria con el tiempo que le queda"""
+        if self.store is None:
+            return False, None
+        row = self.store.get(self._store_key(key))
+        if row is None:
+            return False, None
+        content, _, _, expires_at = row
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return False, None
+        try:
+            value = json.loads(content)
+        except ValueError:
+            return False, None
+        with self._lock:
+            self.disk_hits += 1
+        self._insert(key, value, remaining)
+        return True, value
+
+    def _insert(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, query, market):
+        """(encontrada, valor); valor es None si se guardó que la búsqueda no tiene resultados"""
+        if self.max_entries <= 0:
+            return False, None
+        key = self.make_key(query, market)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            found, value = self._load(key)
+            if not found:
+                with self._lock:
+                    self.misses += 1
+                return False, None
+            entry = (None, value)
+        with self._lock:
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+        return True, entry[1]
+
+    def put(self, query, market, value):
+        if self.max_entries <= 0:
+            return
+        key = self.make_key(query, market)
+        if not key[1]:
+            return
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._insert(key, value, ttl)
+        if self.store is not None and ttl > 0:
+            content = json.dumps(value, separators=(',', ':')).encode('utf-8')
+            self.store.put(self._store_key(key), content, 'application/json', None, time.time() + ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses
+            }
+            if self.store is not None:
+                stats["disk_hits"] = self.disk_hits
+        return stats
@@ -0,0 +1,209 @@
+"""Benchmark de arranque en frío del servidor MCP por stdio
+
+Cada medición usa un proceso de Python nuevo, como cuando el cliente MCP lanza el servidor:
+  - import: tiempo de `import spotify_mcp` según `python -X importtime` y los imports directos más caros
+  - list_tools: desde que se lanza spotify_mcp.py hasta la respuesta a tools/list (handshake incluido)
+Termina con código 1 si la mediana de list_tools supera --target-ms, para usarlo como chequeo de regresión.
+
+Uso:
+    python src/spotify_startup_benchmark.py --runs 5 --target-ms 1500
+    python src/spotify_startup_benchmark.py --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+from spotify_mock_api import MockSpotifyServer, MockState
+from spotify_benchmark import configure_environment
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(SRC_DIR, 'spotify_mcp.py')
+
+# Request que hace el precalentamiento tras el handshake (ver prewarm en spotify_mcp.py)
+PREWARM_ENDPOINT = 'GET /v1/me/player'
+
+
+def parse_importtime(stderr, module='spotify_mcp'):
+    """(total en ms, imports directos del módulo ordenados por coste, módulos cargados) de la salida de -X importtime"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1000))
+
+    # -X importtime lista cada módulo después de sus dependencias: los hijos directos preceden a la línea del padre
+    total = 0.0
+    children = []
+    for index, (depth, name, cumulative) in enumerate(entries):
+        if depth == 0 and name == module:
+            total = cumulative
+            for child_depth, child, child_ms in reversed(entries[:index]):
+                if child_depth == 0:
+                    break
+                if child_depth == 1:
+                    children.append((child, child_ms))
+            break
+    children.sort(key=lambda child: -child[1])
+    return total, children, {name for _, name, _ in entries}
+
+
+def measure_import(env):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import spotify_mcp'],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def send(process, message):
+    process.stdin.write(json.dumps(message) + '\n')
+    process.stdin.flush()
+
+
+def receive(process, request_id):
+    """Lee mensajes JSON-RPC del servidor hasta la respuesta a request_id (ignora notificaciones)"""
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError("El servidor terminó antes de responder")
+        message = json.loads(line)
+        if message.get('id') == request_id:
+            if 'error' in message:
+                raise RuntimeError(f"Error del servidor: {message['error']}")
+            return message['result']
+
+
+def measure_first_list_tools(env, state, protocol_version, prewarm_timeout):
+    """Lanza el servidor por stdio y mide initialize y el primer tools/list; comprueba el precalentamiento"""
+    state.reset()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT], cwd=SRC_DIR, env=env, text=True,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        send(process, {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": protocol_version,
+            "capabilities": {},
+            "clientInfo": {"name": "spotify-startup-benchmark", "version": "1.0"}
+        }})
+        receive(process, 1)
+        initialized = time.perf_counter()
+        send(process, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+        send(process, {"jsonrpc": "2.0", "id": 2, "method": "tools/list"})
+        tools = receive(process, 2)["tools"]
+        listed = time.perf_counter()
+
+        # El precalentamiento corre en segundo plano: se espera a que llegue al mock
+        deadline = time.monotonic() + prewarm_timeout
+        while not state.stats()["endpoints"].get(PREWARM_ENDPOINT) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        prewarmed = time.perf_counter() if state.stats()["endpoints"].get(PREWARM_ENDPOINT) else None
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    return {
+        "initialize_ms": (initialized - start) * 1000,
+        "list_tools_ms": (listed - start) * 1000,
+        "prewarm_ms": (prewarmed - start) * 1000 if prewarmed else None,
+        "tools": len(tools)
+    }
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def run_benchmark(args):
+    state = MockState(args.latency_ms, 0, 0, 1, 0, seed=1)
+    server = MockSpotifyServer(('127.0.0.1', 0), state)
+    configure_environment(server.start(), argparse.Namespace(rate_limit=0, no_cache=False))
+    env = dict(os.environ)
+
+    from mcp.types import LATEST_PROTOCOL_VERSION
+
+    imports = []
+    starts = []
+    try:
+        for _ in range(args.runs):
+            imports.append(measure_import(env))
+            starts.append(measure_first_list_tools(env, state, LATEST_PROTOCOL_VERSION, args.prewarm_timeout))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Imports directos de la última corrida (con caché de disco caliente, como en un uso normal)
+    _, children, loaded = imports[-1]
+    list_tools = summarize([s["list_tools_ms"] for s in starts])
+    return {
+        "config": vars(args),
+        "import_ms": summarize([total for total, _, _ in imports]),
+        "initialize_ms": summarize([s["initialize_ms"] for s in starts]),
+        "list_tools_ms": list_tools,
+        "prewarm_ms": summarize([s["prewarm_ms"] for s in starts]),
+        "prewarmed_runs": sum(1 for s in starts if s["prewarm_ms"] is not None),
+        "tools": starts[-1]["tools"],
+        "top_imports": [{"module": name, "ms": ms} for name, ms in children[:args.top]],
+        "requests_imported": 'requests' in loaded,
+        "target_ms": args.target_ms,
+        "passed": list_tools["median"] <= args.target_ms
+    }
+
+
+def print_report(report):
+    def row(label, summary):
+        if summary is None:
+            print(f"{label:<28}        -")
+            return
+        print(f"{label:<28}{summary['median']:9.1f}{summary['min']:9.1f}{summary['max']:9.1f}")
+
+    print(f"{'':<28}{'median':>9}{'min':>9}{'max':>9}")
+    row("import spotify_mcp (ms)", report["import_ms"])
+    row("initialize (ms)", report["initialize_ms"])
+    row("primer list_tools (ms)", report["list_tools_ms"])
+    row("precalentamiento (ms)", report["prewarm_ms"])
+    print(f"\nHerramientas: {report['tools']}  precalentadas: {report['prewarmed_runs']}/{report['config']['runs']}"
+          f"  requests importado al arrancar: {'sí' if report['requests_imported'] else 'no'}")
+    print("\nImports directos más caros:")
+    for entry in report["top_imports"]:
+        print(f"  {entry['ms']:8.1f} ms  {entry['module']}")
+    verdict = "OK" if report["passed"] else "SUPERADO"
+    print(f"\nObjetivo primer list_tools: {report['target_ms']:.0f} ms -> {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío del servidor MCP por stdio")
+    parser.add_argument('--runs', type=int, default=5, help="Procesos nuevos a medir")
+    parser.add_argument('--target-ms', type=float, default=float(os.getenv('SPOTIFY_STARTUP_TARGET_MS', '1500')),
+                        help="Mediana máxima aceptada de lanzamiento a primer list_tools")
+    parser.add_argument('--latency-ms', type=float, default=20, help="Latencia simulada del mock (afecta al precalentamiento)")
+    parser.add_argument('--prewarm-timeout', type=float, default=3, help="Segundos que se espera al precalentamiento")
+    parser.add_argument('--top', type=int, default=10, help="Imports directos a mostrar")
+    parser.add_argument('--json', action='store_true', help="Imprime el resultado como JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, SRC_DIR)
+    main()
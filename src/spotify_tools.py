@@ -0,0 +1,153 @@
+from mcp.types import Tool
+
+# Nombre en los mensajes de error de cada tipo de JSON Schema y tipos de Python que lo satisfacen
+TYPE_NAMES = {
+    'string': 'texto',
+    'integer': 'un entero',
+    'number': 'un número',
+    'boolean': 'verdadero o falso',
+    'array': 'una lista',
+    'object': 'un objeto'
+}
+PYTHON_TYPES = {
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+    'array': list,
+    'object': dict
+}
+
+
+class ToolArgumentError(ValueError):
+    """Argumento de herramienta que no cumple su esquema"""
+
+
+def compile_type_check(schema_type):
+    """Función que indica si un valor es del tipo del esquema (bool no cuenta como número)"""
+    python_type = PYTHON_TYPES.get(schema_type)
+    if python_type is None:
+        return lambda value: True
+    if schema_type in ('integer', 'number'):
+        return lambda value: isinstance(value, python_type) and not isinstance(value, bool)
+    return lambda value: isinstance(value, python_type)
+
+
+def compile_property(name, schema):
+    """Convierte el esquema de una propiedad en una función de validación, una sola vez al registrar"""
+    schema_type = schema.get('type')
+    is_type = compile_type_check(schema_type)
+    type_error = f"{name} debe ser {TYPE_NAMES.get(schema_type, schema_type)}"
+    checks = []
+
+    if 'enum' in schema:
+        allowed = frozenset(schema['enum'])
+        message = f"{name} debe ser: {', '.join(str(v) for v in schema['enum'])}"
+        checks.append(lambda value: value in allowed or message)
+
+    minimum = schema.get('minimum')
+    maximum = schema.get('maximum')
+    if minimum is not None and maximum is not None:
+        message = f"{name} debe estar entre {minimum} y {maximum}"
+        checks.append(lambda value: minimum <= value <= maximum or message)
+    elif minimum is not None:
+        message = f"{name} debe ser mayor o igual que {minimum}"
+        checks.append(lambda value: value >= minimum or message)
+    elif maximum is not None:
+        message = f"{name} debe ser menor o igual que {maximum}"
+        checks.append(lambda value: value <= maximum or message)
+
+    if schema.get('minLength'):
+        min_length = schema['minLength']
+        message = f"{name} no puede estar vacío" if min_length == 1 else f"{name} debe tener al menos {min_length} caracteres"
+        checks.append(lambda value: len(value.strip()) >= min_length or message)
+
+    if schema_type == 'array':
+        min_items = schema.get('minItems', 0)
+        max_items = schema.get('maxItems')
+        if max_items is not None:
+            message = f"{name} debe tener entre {min_items} y {max_items} elementos"
+            checks.append(lambda value: min_items <= len(value) <= max_items or message)
+        elif min_items:
+            message = f"{name} debe tener al menos {min_items} elementos"
+            checks.append(lambda value: len(value) >= min_items or message)
+        if 'items' in schema:
+            check_item = compile_property(f"{name}[]", schema['items'])
+
+            def check_items(value):
+                for item in value:
+                    check_item(item)
+                return True
+            checks.append(check_items)
+
+    def check(value):
+        if not is_type(value):
+            raise ToolArgumentError(type_error)
+        for rule in checks:
+            outcome = rule(value)
+            if outcome is not True:
+                raise ToolArgumentError(outcome)
+        return value
+
+    return check
+
+
+class ToolSpec:
+    """Herramienta registrada: esquema MCP, validadores precompilados y función que la implementa"""
+
+    __slots__ = ('name', 'tool', 'handler', 'defaults', 'checks', 'required', 'cancellable')
+
+    def __init__(self, name, description, handler, properties=None, required=(), cancellable=False):
+        properties = properties or {}
+        self.name = name
+        self.handler = handler
+        self.required = frozenset(required)
+        self.cancellable = cancellable
+        self.defaults = {key: schema['default'] for key, schema in properties.items() if 'default' in schema}
+        self.checks = {key: compile_property(key, schema) for key, schema in properties.items()}
+        self.tool = Tool(
+            name=name,
+            description=description,
+            inputSchema={"type": "object", "properties": dict(properties), "required": list(required)}
+        )
+
+    def bind(self, arguments):
+        """Argumentos validados (con los valores por defecto) como kwargs del handler
+
+        Los argumentos nulos cuentan como ausentes; los que no están en el esquema se ignoran.
+        Lanza ToolArgumentError con un mensaje para el usuario.
+        """
+        kwargs = dict(self.defaults)
+        for key, check in self.checks.items():
+            value = arguments.get(key)
+            if value is None:
+                if key in self.required:
+                    raise ToolArgumentError(f"Falta el parámetro requerido: {key}")
+                continue
+            kwargs[key] = check(value)
+        return kwargs
+
+
+class ToolRegistry:
+    """Tabla de herramientas: búsqueda O(1) por nombre y lista de list_tools construida una sola vez"""
+
+    def __init__(self, common_properties=None):
+        self.common_properties = common_properties or {}
+        self._specs = {}
+        self._tools = None
+
+    def add(self, name, description, handler, properties=None, required=(), cancellable=False):
+        spec = ToolSpec(name, description, handler, properties, required, cancellable)
+        # Las propiedades comunes solo se anuncian; no se pasan al handler
+        spec.tool.inputSchema["properties"].update(self.common_properties)
+        self._specs[name] = spec
+        self._tools = None
+        return spec
+
+    def get(self, name):
+        return self._specs.get(name)
+
+    def tools(self):
+        if self._tools is None:
+            self._tools = [spec.tool for spec in self._specs.values()]
+        return self._tools